@@ -0,0 +1,170 @@
+"""
+Backfill of a project's Elasticsearch index from S3
+===================================================
+
+Lists the tweet objects of a project (`STORAGE_BUCKET_PREFIX{slug}/`)
+and indexes them with the pipeline of lambda-s3-to-es, on a pool of
+workers. Completed keys are appended to a checkpoint file, so an
+interrupted backfill resumes where it stopped. Tweets indexed twice
+are counted as existing, not duplicated.
+
+    backfill-es my-project --index project_my-project_1612345678
+"""
+
+import os
+import time
+import logging
+import argparse
+import threading
+from collections import Counter
+from concurrent.futures import (ThreadPoolExecutor, wait,
+                                FIRST_COMPLETED)
+
+from .env import AWSEnv, BackfillEnv
+from .session import get_client
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+
+def list_keys(bucket, prefix, s3_client=None):
+    """Yields the keys of the objects under prefix."""
+    s3_client = s3_client or get_client('s3')
+    params = {'Bucket': bucket, 'Prefix': prefix}
+    while True:
+        response = s3_client.list_objects_v2(**params)
+        for item in response.get('Contents', []):
+            yield item['Key']
+        if not response.get('IsTruncated'):
+            return
+        params['ContinuationToken'] = response['NextContinuationToken']
+
+
+class Checkpoint():
+    """Keys already indexed, one per line in an append-only file."""
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.done = set()
+        if os.path.isfile(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.done = {line.rstrip('\n') for line in f if line.strip()}
+
+    def add(self, key):
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(key + '\n')
+            self.done.add(key)
+
+
+def checkpoint_path(index_name):
+    return os.path.join(BackfillEnv.CHECKPOINT_DIR, f'{index_name}.done')
+
+
+def backfill(
+    slug, index_name=None, pipeline=None, checkpoint=None,
+    max_workers=BackfillEnv.MAX_WORKERS, bucket=AWSEnv.BUCKET_NAME,
+    s3_client=None
+):
+    """Indexes the objects of a project that are not checkpointed.
+
+    Indexes into `index_name`, by default the latest index of the
+    project. Objects are only checkpointed when none of their tweets
+    failed, so that a rerun retries them. Returns the indexing results,
+    with the number of objects done, skipped and failed.
+    """
+    if pipeline is None:
+        from .pipeline import Pipeline
+        pipeline = Pipeline(s3_client=s3_client)
+    project = pipeline.project(slug, index_name)
+    if checkpoint is None:
+        os.makedirs(BackfillEnv.CHECKPOINT_DIR, exist_ok=True)
+        checkpoint = Checkpoint(checkpoint_path(project.index_name))
+
+    prefix = f'{AWSEnv.STORAGE_BUCKET_PREFIX}{slug}/'
+    logger.info(
+        'Backfilling %s from s3://%s/%s with %d worker(s), %d object(s) '
+        'already done.', project.index_name, bucket, prefix, max_workers,
+        len(checkpoint.done))
+
+    def run(key):
+        results = pipeline.index_object(bucket, key, project)
+        if not results['failed']:
+            checkpoint.add(key)
+        return results
+
+    totals = Counter()
+    start = time.perf_counter()
+    keys = list_keys(bucket, prefix, s3_client)
+    pending = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        try:
+            for key in keys:
+                if key in checkpoint.done:
+                    totals['objects_skipped'] += 1
+                    continue
+                # Keep a bounded number of objects in flight
+                while len(pending) >= 2 * max_workers:
+                    _collect(pending, totals, start)
+                pending[executor.submit(run, key)] = key
+            while pending:
+                _collect(pending, totals, start)
+        except KeyboardInterrupt:
+            logger.warning(
+                'Interrupted, waiting for %d object(s) in flight.',
+                len(pending))
+            while pending:
+                _collect(pending, totals, start)
+            raise
+    return totals
+
+
+def _collect(pending, totals, start):
+    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+    for future in done:
+        key = pending.pop(future)
+        try:
+            results = future.result()
+        except Exception as exc:
+            logger.error(
+                'Object %s failed %s: %s', key, type(exc).__name__, str(exc))
+            totals['objects_failed'] += 1
+            continue
+        totals.update(results)
+        totals['objects_done' if not results['failed']
+               else 'objects_failed'] += 1
+    logger.info(
+        '%d object(s) done, %d failed, %d document(s) created in %.0f s.',
+        totals['objects_done'], totals['objects_failed'],
+        totals['created'], time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Indexes a project's tweets on S3 into Elasticsearch.")
+    parser.add_argument('slug', help='project slug')
+    parser.add_argument(
+        '--index', help='index name, by default the latest of the project')
+    parser.add_argument(
+        '--workers', type=int, default=BackfillEnv.MAX_WORKERS,
+        help='number of objects indexed at once')
+    parser.add_argument(
+        '--checkpoint',
+        help='file of the keys already indexed, by default '
+             f'{BackfillEnv.CHECKPOINT_DIR}/<index>.done')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    totals = backfill(
+        args.slug, args.index,
+        checkpoint=Checkpoint(args.checkpoint) if args.checkpoint else None,
+        max_workers=args.workers)
+    print(
+        f"{totals['objects_done']} object(s) done, "
+        f"{totals['objects_skipped']} skipped, "
+        f"{totals['objects_failed']} failed: "
+        f"{totals['created']} created, {totals['exists']} already "
+        f"indexed, {totals['mapping_error']} mapping errors, "
+        f"{totals['failed']} failed.")
+    if totals['objects_failed']:
+        raise SystemExit(1)
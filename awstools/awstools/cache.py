@@ -0,0 +1,69 @@
+"""
+Cache of small JSON documents on S3 (configs, index registry), shared
+by the invocations of a warm Lambda container.
+"""
+
+import logging
+import time
+import threading
+from copy import deepcopy
+
+from botocore.exceptions import ClientError
+
+from . import jsoncodec
+from .env import CacheEnv
+from .session import get_client
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+
+class DocumentCache():
+    """Keeps decoded JSON documents for `ttl` seconds.
+
+    Expired entries are revalidated with a conditional GET on their
+    ETag, so unchanged documents are not downloaded again. Callers get
+    copies, which they may modify.
+    """
+    def __init__(self, ttl=CacheEnv.TTL, s3_client=None):
+        self.ttl = ttl
+        self.s3_client = s3_client
+        self._lock = threading.Lock()
+        # (bucket, key) -> (document, etag, validated at)
+        self._entries = {}
+
+    def get(self, bucket, key):
+        """Returns the decoded document, raises if it does not exist."""
+        with self._lock:
+            entry = self._entries.get((bucket, key))
+        if entry is not None and time.monotonic() - entry[2] < self.ttl:
+            return deepcopy(entry[0])
+
+        s3_client = self.s3_client or get_client('s3')
+        params = {'Bucket': bucket, 'Key': key}
+        if entry is not None:
+            params['IfNoneMatch'] = entry[1]
+        try:
+            response = s3_client.get_object(**params)
+            document = jsoncodec.loads(response['Body'].read())
+            etag = response['ETag']
+        except ClientError as exc:
+            code = exc.response['Error']['Code']
+            if entry is None or code not in ['304', 'NotModified']:
+                raise exc
+            document, etag = entry[0], entry[1]
+        with self._lock:
+            self._entries[bucket, key] = (document, etag, time.monotonic())
+        return deepcopy(document)
+
+    def invalidate(self, bucket=None, key=None):
+        """Drops one document, or all of them."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop((bucket, key), None)
+
+
+# Shared by all modules of a process
+document_cache = DocumentCache()
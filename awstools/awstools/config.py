@@ -1,12 +1,14 @@
 import logging
 import json
+import threading
 
 from enum import Enum
 from typing import List, Dict, Set, Optional
 from dataclasses import dataclass, asdict, field
 
 import dacite
-from .s3 import get_s3_object, s3
+from . import jsoncodec
+from .s3 import get_s3_object
 from .env import AWSEnv
 
 logger = logging.getLogger(__name__)
@@ -42,6 +44,7 @@ class Conf:
     storage_mode: StorageMode
     image_storage_mode: ImageStorageMode
     model_endpoints: Optional[Dict]
+    extract_geo: bool = True
 
 
 @dataclass(frozen=True)
@@ -51,15 +54,22 @@ class FilterConf:
 
 
 class ConfigManager():
-    """Read, write and validate project configs."""
-    def __init__(self, s3_client=s3, version_id=None):
-        self.dict, self.config = self._load(s3_client, version_id)
+    """Read, write and validate project configs.
+
+    The config is downloaded from S3, unless an already loaded
+    raw config (list of dicts) is given.
+    """
+    def __init__(self, s3_client=None, version_id=None, raw=None):
+        if raw is None:
+            raw = jsoncodec.loads(get_s3_object(
+                AWSEnv.BUCKET_NAME, AWSEnv.STREAM_CONFIG_S3_KEY,
+                s3_client, version_id))
+        self.dict, self.config = self._load(raw)
         self.filter_config = self._pool_config()
+        self._confs_by_slug = {conf.slug: conf for conf in self.config}
 
     def get_conf_by_slug(self, slug):
-        for conf in self.config:
-            if conf.slug == slug:
-                return conf
+        return self._confs_by_slug.get(slug)
 
     def get_tracking_info(self, slug):
         """Adds tracking info to all tweets before pushing to S3."""
@@ -73,10 +83,7 @@ class ConfigManager():
     def write(self):
         return json.dumps([conf for conf in self.dict], indent=4)
 
-    def _load(self, s3_client, version_id):
-        raw = json.loads(get_s3_object(
-            AWSEnv.BUCKET_NAME, AWSEnv.STREAM_CONFIG_S3_KEY,
-            s3_client, version_id))
+    def _load(self, raw):
         # Sort raw by slug
         raw = sorted(raw, key=lambda conf: conf['slug'])
         # What is this even???
@@ -98,4 +105,21 @@ class ConfigManager():
         return filter_conf
 
 
-config_manager = ConfigManager()
+_lock = threading.Lock()
+_config_manager = None
+
+
+def get_config_manager():
+    """Returns the shared config manager, loaded on first use."""
+    global _config_manager
+    with _lock:
+        if _config_manager is None:
+            _config_manager = ConfigManager()
+        return _config_manager
+
+
+def __getattr__(name):
+    # `config_manager` is loaded lazily (PEP 562)
+    if name == 'config_manager':
+        return get_config_manager()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -2,16 +2,24 @@ import logging
 import json
 import os
 import io
+import threading
+import time
+from collections import Counter
 from pathlib import Path
 from datetime import datetime
 
+from . import jsoncodec
 from .env import ESEnv
-from .session import s3, es
+from . import session
+from .cache import document_cache
 from .s3 import get_long_s3_object
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
+# Guards the read-modify-write of the indices JSON on S3
+_indices_lock = threading.Lock()
+
 
 # https://developer.twitter.com/en/docs/twitter-for-websites/supported-languages
 twi_langs = {
@@ -78,28 +86,144 @@ def create_index(slug, lang, only_new=False):
     index_name = ESEnv.INDEX_PREFIX + \
         slug + '_' + now.strftime('%Y-%m-%d_%H-%M-%S')
 
-    indices = json.loads(get_long_s3_object(
-        ESEnv.BUCKET_NAME, ESEnv.CONFIG_S3_KEY,
-        {'CompressionType': 'NONE', 'JSON': {'Type': 'DOCUMENT'}}))
-    if only_new:
-        # When a new project is created, we want to create an index for it
-        # and not touch the rest
-        if indices.get(slug) is None:
-            indices[slug] = [index_name]
+    with _indices_lock:
+        indices = jsoncodec.loads(get_long_s3_object(
+            ESEnv.BUCKET_NAME, ESEnv.CONFIG_S3_KEY,
+            {'CompressionType': 'NONE', 'JSON': {'Type': 'DOCUMENT'}}))
+        if only_new:
+            # When a new project is created, we want to create an index for
+            # it and not touch the rest
+            if indices.get(slug) is None:
+                indices[slug] = [index_name]
+            else:
+                index_name = indices[slug][-1]
         else:
-            index_name = indices[slug][-1]
-    else:
-        try:
-            indices[slug].append(index_name)
-        except KeyError:
-            indices[slug] = [index_name]
+            try:
+                indices[slug].append(index_name)
+            except KeyError:
+                indices[slug] = [index_name]
 
-    indices = io.BytesIO(bytes(json.dumps(indices), encoding='utf-8'))
-    s3.upload_fileobj(indices, ESEnv.BUCKET_NAME, ESEnv.CONFIG_S3_KEY)
-    logger.info('Indices JSON updated.')
+        indices = io.BytesIO(bytes(json.dumps(indices), encoding='utf-8'))
+        session.s3.upload_fileobj(
+            indices, ESEnv.BUCKET_NAME, ESEnv.CONFIG_S3_KEY)
+        document_cache.invalidate(ESEnv.BUCKET_NAME, ESEnv.CONFIG_S3_KEY)
+        logger.info('Indices JSON updated.')
 
-    if es.indices.exists(index_name):
+    if session.es.indices.exists(index_name):
         logger.info('Index %s already exists.', index_name)
     else:
         logger.info('Created index %s.', index_name)
-        es.indices.create(index_name, body=mapping)
+        session.es.indices.create(index_name, body=mapping)
+    return index_name
+
+
+def index_exists(index_name):
+    return session.es.indices.exists(index_name)
+
+
+class BulkIndexer():
+    """Creates documents with the bulk API.
+
+    Documents are sent in chunks of at most `chunk_docs` documents and
+    `chunk_bytes` bytes. Every item is classified as created, exists
+    (a document with that ID is already indexed), mapping_error or
+    failed. Items rejected with 429 or 5xx are retried with exponential
+    backoff, up to `max_retries` times, and count as failed after that.
+    """
+    RESULTS = ['created', 'exists', 'mapping_error', 'failed']
+
+    def __init__(
+        self, es_client=None,
+        chunk_docs=ESEnv.BULK_CHUNK_DOCS,
+        chunk_bytes=ESEnv.BULK_CHUNK_BYTES,
+        max_retries=ESEnv.BULK_MAX_RETRIES,
+        backoff=1.
+    ):
+        self.es_client = es_client
+        self.chunk_docs = chunk_docs
+        self.chunk_bytes = chunk_bytes
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+    def create(self, index_name, docs):
+        """Indexes (doc_id, doc) pairs, returns a Counter of results."""
+        results = Counter({result: 0 for result in self.RESULTS})
+        chunk = []
+        chunk_bytes = 0
+        for doc_id, doc in docs:
+            item = (
+                jsoncodec.dumps_line({'create': {'_id': doc_id}}) +
+                jsoncodec.dumps_line(doc))
+            if chunk and (
+                    len(chunk) >= self.chunk_docs or
+                    chunk_bytes + len(item) > self.chunk_bytes):
+                results.update(self._send(index_name, chunk))
+                chunk = []
+                chunk_bytes = 0
+            chunk.append((doc_id, item))
+            chunk_bytes += len(item)
+        if chunk:
+            results.update(self._send(index_name, chunk))
+        return results
+
+    def _send(self, index_name, chunk):
+        from elasticsearch import TransportError
+
+        es = self.es_client or session.es
+        results = Counter()
+        attempt = 0
+        while chunk:
+            retry = []
+            try:
+                response = es.bulk(
+                    body=b''.join(item for _, item in chunk),
+                    index=index_name, doc_type='_doc')
+            except TransportError as exc:
+                if not _is_retryable(exc.status_code):
+                    logger.error(
+                        'Bulk request failed %s: %s',
+                        type(exc).__name__, str(exc))
+                    results['failed'] += len(chunk)
+                    return results
+                retry = chunk
+            else:
+                for (doc_id, item), response_item in zip(
+                        chunk, response['items']):
+                    result = _classify(response_item['create'])
+                    if result == 'retry':
+                        retry.append((doc_id, item))
+                    else:
+                        results[result] += 1
+                        if result in ['mapping_error', 'failed']:
+                            logger.error(
+                                'Document %s rejected: %s', doc_id,
+                                response_item['create'].get('error'))
+            if retry and attempt >= self.max_retries:
+                logger.error(
+                    'Giving up on %d document(s) after %d retries.',
+                    len(retry), attempt)
+                results['failed'] += len(retry)
+                break
+            if retry:
+                time.sleep(self.backoff * 2 ** attempt)
+                attempt += 1
+            chunk = retry
+        return results
+
+
+def _is_retryable(status):
+    # Connection errors have no status code ('N/A')
+    return not isinstance(status, int) or status == 429 or status >= 500
+
+
+def _classify(item):
+    status = item['status']
+    if status in [200, 201]:
+        return 'created'
+    if status == 409:
+        return 'exists'
+    if status == 429 or status >= 500:
+        return 'retry'
+    if status == 400:
+        return 'mapping_error'
+    return 'failed'
@@ -56,6 +56,11 @@ class AWSEnv(Env):
         'LAMBDA_S3_ES_NAME', 's3-to-es')
 
 
+class CacheEnv(AWSEnv):
+    # Seconds before cached config documents are revalidated
+    TTL = int(os.environ.get('CONFIG_CACHE_TTL', '60'))
+
+
 class KFEnv(AWSEnv):
     ROLE_TRUST_RELATIONSHIP_PATH = os.path.join(
         AWSEnv.CONFIG_PATH,
@@ -67,6 +72,9 @@ class KFEnv(AWSEnv):
     BUFFER_INTERVAL = int(os.environ.get('AWS_KF_BUFFER_INTERVAL', '60'))
     UNMATCHED_STREAM_NAME = os.environ.get(
         'AWS_KF_UNMATCHED_STREAM_NAME', 'unmatched')
+    # Batching of records sent by the streamer (seconds)
+    BATCH_LINGER = float(os.environ.get('AWS_KF_BATCH_LINGER', '1.0'))
+    BATCH_MAX_RETRIES = int(os.environ.get('AWS_KF_BATCH_MAX_RETRIES', '3'))
 
 
 class LEnv(AWSEnv):
@@ -79,6 +87,25 @@ class LEnv(AWSEnv):
     MEMORY_SIZE = int(os.environ.get('AWS_L_MEMORY_SIZE', '128'))
     BUCKET_FOLDER = os.environ.get('AWS_L_BUCKET_FOLDER', 'lambda/')
     EXTENSION = os.environ.get('AWS_L_EXTENSION', 'zip')
+    # S3 objects processed at once by an invocation of lambda-s3-to-es,
+    # and the seconds that must be left to start another one
+    MAX_CONCURRENT_RECORDS = int(os.environ.get(
+        'AWS_L_MAX_CONCURRENT_RECORDS', '4'))
+    TIME_MARGIN = int(os.environ.get('AWS_L_TIME_MARGIN', '30'))
+    # Statuses predicted and indexed at once, bounds the memory used
+    CHUNK_SIZE = int(os.environ.get('AWS_L_CHUNK_SIZE', '500'))
+    # Chunks read ahead from S3 while a chunk is processed
+    PREFETCH_CHUNKS = int(os.environ.get('AWS_L_PREFETCH_CHUNKS', '2'))
+    # Distinct user locations kept decoded
+    GEO_CACHE_SIZE = int(os.environ.get('AWS_L_GEO_CACHE_SIZE', '50000'))
+    # Empty for the index built into the geocode package of the layer
+    GEOCODE_INDEX_PATH = os.environ.get('AWS_L_GEOCODE_INDEX_PATH', '')
+
+
+class BackfillEnv(AWSEnv):
+    # Objects indexed at once, and where completed keys are recorded
+    MAX_WORKERS = int(os.environ.get('BACKFILL_MAX_WORKERS', '8'))
+    CHECKPOINT_DIR = os.environ.get('BACKFILL_CHECKPOINT_DIR', 'backfill')
 
 
 class ESEnv(AWSEnv):
@@ -88,13 +115,35 @@ class ESEnv(AWSEnv):
     DOMAIN = os.environ.get('ES_DOMAIN', Env.APP_NAME + '-' + Env.ENV)
     CONFIG_S3_KEY = os.environ.get(
         'ES_CONFIG_S3_KEY', 'configs/stream/elasticsearch.json')
+    # Bulk indexing chunks, in documents and bytes
+    BULK_CHUNK_DOCS = int(os.environ.get('ES_BULK_CHUNK_DOCS', '500'))
+    BULK_CHUNK_BYTES = int(os.environ.get(
+        'ES_BULK_CHUNK_BYTES', str(5 * 1024 ** 2)))
+    BULK_MAX_RETRIES = int(os.environ.get('ES_BULK_MAX_RETRIES', '3'))
 
 
 class ECSEnv(AWSEnv):
     CLUSTER = os.environ.get('ECS_CLUSTER')
     SERVICE = os.environ.get('ECS_SERVICE')
+    # Seconds between config checks of the streamer, as in its
+    # ConfigEnv. With 0 it does not reload, changes restart it.
+    CONFIG_POLL_INTERVAL = int(os.environ.get('CONFIG_POLL_INTERVAL', '60'))
 
 
 class SMEnv(AWSEnv):
     BATCH_SIZE_DEFAULT = int(os.environ.get('BATCH_SIZE_DEFAULT', '1'))
     BATCH_SIZE_FASTTEXT = int(os.environ.get('BATCH_SIZE_FASTTEXT', '100'))
+    # Concurrent inference requests, in total and per endpoint
+    MAX_WORKERS = int(os.environ.get('SM_MAX_WORKERS', '16'))
+    MAX_CONCURRENCY_PER_ENDPOINT = int(os.environ.get(
+        'SM_MAX_CONCURRENCY_PER_ENDPOINT', '4'))
+    # Predictions kept in memory, and the shared store behind them:
+    # none, sqlite (PREDICTION_CACHE_PATH) or dynamodb
+    PREDICTION_CACHE_SIZE = int(os.environ.get(
+        'PREDICTION_CACHE_SIZE', '100000'))
+    PREDICTION_CACHE_STORE = os.environ.get(
+        'PREDICTION_CACHE_STORE', 'none').lower()
+    PREDICTION_CACHE_PATH = os.environ.get(
+        'PREDICTION_CACHE_PATH', '/tmp/predictions.sqlite')
+    PREDICTION_CACHE_TABLE = os.environ.get(
+        'PREDICTION_CACHE_TABLE', f'{AWSEnv.APP_NAME}-predictions')
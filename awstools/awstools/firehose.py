@@ -1,12 +1,16 @@
 import logging
 import time
+import threading
 
 from .env import KFEnv
-from .session import iam, firehose
+from . import session
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
+# Delivery stream statuses that never turn into ACTIVE
+FAILED_STATUSES = ['CREATING_FAILED', 'DELETING', 'DELETING_FAILED']
+
 
 def get_bucket_arn(bucket_name):
     return f'arn:aws:s3:::{bucket_name}'
@@ -48,7 +52,7 @@ def create_firehose_role(slug):
             role_trust_relationship)
 
     try:
-        response = iam.create_role(
+        response = session.iam.create_role(
             RoleName=role_name,
             AssumeRolePolicyDocument=role_trust_relationship,
             Description=f'Role automatically created for project {slug} '
@@ -66,7 +70,7 @@ def create_firehose_role(slug):
         logger.info(
             'Created role %s with ID %s for project %s.',
             response['Role']['RoleName'], response['Role']['RoleId'], slug)
-    except iam.exceptions.EntityAlreadyExistsException:
+    except session.iam.exceptions.EntityAlreadyExistsException:
         pass
 
     with open(KFEnv.POLICY_PATH, 'r') as f:
@@ -76,7 +80,7 @@ def create_firehose_role(slug):
         policy = policy.replace('REGION', KFEnv.REGION)
 
     try:
-        response = iam.create_policy(
+        response = session.iam.create_policy(
             PolicyName=policy_name,
             PolicyDocument=policy,
             Description=f'Policy automatically created for project {slug} '
@@ -88,10 +92,10 @@ def create_firehose_role(slug):
             'Created policy %s with ID %s for project %s.',
             response['Policy']['PolicyName'], response['Policy']['PolicyId'],
             slug)
-    except iam.exceptions.EntityAlreadyExistsException:
+    except session.iam.exceptions.EntityAlreadyExistsException:
         pass
 
-    response = iam.attach_role_policy(
+    response = session.iam.attach_role_policy(
         PolicyArn=policy_arn,
         RoleName=role_name
     )
@@ -105,77 +109,256 @@ def create_firehose_role(slug):
     return
 
 
-def create_delivery_stream(slug, prefix):
+def create_delivery_stream(slug, prefix, timeout=600):
     create_firehose_role(slug)
 
     _, role_arn = get_role_name_arn(slug)
     stream_name, _ = get_stream_name_arn(slug)
 
-    time.sleep(10)
-
-    stream_name = f'{KFEnv.APP_NAME}-{slug}'
-
-    try:
-        response = firehose.create_delivery_stream(
-            DeliveryStreamName=stream_name,
-            DeliveryStreamType='DirectPut',
-            S3DestinationConfiguration={
-                'RoleARN': role_arn,
-                'BucketARN': get_bucket_arn(KFEnv.BUCKET_NAME),
-                'Prefix': prefix,
-                'ErrorOutputPrefix': f'{slug}/failed/',
-                'BufferingHints': {
-                    'SizeInMBs': KFEnv.BUFFER_SIZE,
-                    'IntervalInSeconds': KFEnv.BUFFER_INTERVAL
-                },
-                'CompressionFormat': 'GZIP',
-            },
-            Tags=[
-                {
-                    'Key': 'project',
-                    'Value': KFEnv.APP_NAME
+    def create():
+        try:
+            session.firehose.create_delivery_stream(
+                DeliveryStreamName=stream_name,
+                DeliveryStreamType='DirectPut',
+                S3DestinationConfiguration={
+                    'RoleARN': role_arn,
+                    'BucketARN': get_bucket_arn(KFEnv.BUCKET_NAME),
+                    'Prefix': prefix,
+                    'ErrorOutputPrefix': f'{slug}/failed/',
+                    'BufferingHints': {
+                        'SizeInMBs': KFEnv.BUFFER_SIZE,
+                        'IntervalInSeconds': KFEnv.BUFFER_INTERVAL
+                    },
+                    'CompressionFormat': 'GZIP',
                 },
-            ]
-        )
+                Tags=[
+                    {
+                        'Key': 'project',
+                        'Value': KFEnv.APP_NAME
+                    },
+                ]
+            )
+            logger.info(
+                'Successfully created delivery stream %s for project %s.',
+                stream_name, slug)
+        except session.firehose.exceptions.ResourceInUseException:
+            logger.info(
+                'Delivery stream %s already exists and in use.',
+                stream_name)
+        except session.firehose.exceptions.InvalidArgumentException as exc:
+            # A freshly created role takes a few seconds to propagate
+            if 'role' not in str(exc).lower():
+                raise
+            logger.info(
+                'Role for delivery stream %s not usable yet.', stream_name)
+            return False
+        return True
 
-        logger.info(
-            'Successfully created delivery stream %s for project %s.',
-            stream_name, slug)
-    except firehose.exceptions.ResourceInUseException:
-        logger.info(
-            'Delivery stream %s already exists and in use.',
-            stream_name)
-
-    response = firehose.describe_delivery_stream(
-        DeliveryStreamName=stream_name)
-    status = response[
-        'DeliveryStreamDescription']['DeliveryStreamStatus']
-    start = time.time()
-    while status != 'ACTIVE':
-        if time.time() - start > 600:
-            logger.warning(
-                'Waiting for more than 10 min. '
-                'Might be a problem with activation of delivery stream %s. '
-                'Please check the AWS console.', stream_name)
-            break
-        response = firehose.describe_delivery_stream(
-            DeliveryStreamName=stream_name)
-        status = response[
-            'DeliveryStreamDescription']['DeliveryStreamStatus']
-        logger.info(
-            'Waiting for delivery stream %s to become active.', stream_name)
-        time.sleep(30)
+    if not wait_until(create, timeout=120):
+        raise TimeoutError(
+            f'Role for delivery stream {stream_name} did not propagate.')
 
-    if status == 'ACTIVE':
+    def is_active():
+        status = get_delivery_stream_status(stream_name)
+        if status in FAILED_STATUSES:
+            # Would never become active, do not wait for the timeout
+            raise RuntimeError(
+                f'Delivery stream {stream_name} is {status}.')
+        if status != 'ACTIVE':
+            logger.info(
+                'Waiting for delivery stream %s to become active.',
+                stream_name)
+        return status == 'ACTIVE'
+
+    if wait_until(is_active, timeout=timeout):
         logger.info(
             'Delivery stream %s is active.', stream_name)
     else:
         logger.warning(
-            'Waited too long for the activation of delivery stream %s.',
-            stream_name)
+            'Waited too long for the activation of delivery stream %s. '
+            'Please check the AWS console.', stream_name)
         raise TimeoutError(
             'Waited too long for the activation of '
             f'delivery stream {stream_name}.'
         )
+    return stream_name
 
-    return
+
+def get_delivery_stream_status(stream_name):
+    """Returns e.g. 'ACTIVE' or 'CREATING', None if it does not exist."""
+    try:
+        response = session.firehose.describe_delivery_stream(
+            DeliveryStreamName=stream_name)
+    except session.firehose.exceptions.ResourceNotFoundException:
+        return None
+    return response['DeliveryStreamDescription']['DeliveryStreamStatus']
+
+
+def wait_until(check, timeout=600, delay=1., max_delay=15.):
+    """Calls `check` with exponential backoff until it returns True.
+
+    Returns False if `timeout` seconds passed first.
+    """
+    deadline = time.monotonic() + timeout
+    while not check():
+        if time.monotonic() + delay > deadline:
+            return False
+        time.sleep(delay)
+        delay = min(delay * 2, max_delay)
+    return True
+
+
+class BatchSender():
+    """Groups records per delivery stream into PutRecordBatch calls.
+
+    A batch is sent as soon as it reaches the PutRecordBatch limits
+    (500 records / 4 MiB) or when it is older than `linger` seconds.
+    Only the records reported as failed are resent. Records that could
+    not be delivered are passed to `on_failure(stream_name, records)`,
+    if given, and are dropped otherwise. `on_send(stream_name, n_records,
+    seconds)` is called after every PutRecordBatch call.
+    """
+    MAX_BATCH_RECORDS = 500
+    MAX_BATCH_BYTES = 4 * 1024 * 1024
+
+    def __init__(
+        self, client=None,
+        linger=KFEnv.BATCH_LINGER,
+        max_retries=KFEnv.BATCH_MAX_RETRIES,
+        on_failure=None,
+        on_send=None
+    ):
+        self.client = client
+        self.linger = linger
+        self.max_retries = max_retries
+        self.on_failure = on_failure
+        self.on_send = on_send
+        self._lock = threading.Lock()
+        self._batches = {}
+        self._closed = threading.Event()
+        self._flusher = None
+
+    def put(self, stream_name, data):
+        """Adds a record (bytes) to the batch of stream_name."""
+        ready = None
+        with self._lock:
+            if self._flusher is None:
+                self._start_flusher()
+            batch = self._batches.get(stream_name)
+            if batch is not None and \
+                    batch['size'] + len(data) > self.MAX_BATCH_BYTES:
+                ready = self._batches.pop(stream_name)
+                batch = None
+            if batch is None:
+                batch = {'records': [], 'size': 0, 'created': time.time()}
+                self._batches[stream_name] = batch
+            batch['records'].append(data)
+            batch['size'] += len(data)
+            if ready is None and \
+                    len(batch['records']) >= self.MAX_BATCH_RECORDS:
+                ready = self._batches.pop(stream_name)
+        if ready is not None:
+            self._send(stream_name, ready['records'])
+
+    def send(self, stream_name, records):
+        """Sends records right away, in as few batches as possible.
+
+        Returns the records that could not be delivered.
+        """
+        failed = []
+        batch = []
+        size = 0
+        for data in records:
+            if len(batch) >= self.MAX_BATCH_RECORDS or \
+                    (batch and size + len(data) > self.MAX_BATCH_BYTES):
+                failed.extend(self._send(stream_name, batch))
+                batch = []
+                size = 0
+            batch.append(data)
+            size += len(data)
+        if batch:
+            failed.extend(self._send(stream_name, batch))
+        return failed
+
+    def flush(self, older_than=None):
+        """Sends all pending batches (or only those older than given s)."""
+        now = time.time()
+        with self._lock:
+            ready = {
+                stream_name: batch
+                for stream_name, batch in self._batches.items()
+                if older_than is None or now - batch['created'] >= older_than}
+            for stream_name in ready:
+                del self._batches[stream_name]
+        for stream_name, batch in ready.items():
+            self._send(stream_name, batch['records'])
+
+    def close(self):
+        self._closed.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.flush()
+
+    def _start_flusher(self):
+        self._flusher = threading.Thread(target=self._flush_periodically)
+        self._flusher.daemon = True
+        self._flusher.start()
+
+    def _flush_periodically(self):
+        while not self._closed.wait(min(self.linger / 2, 1)):
+            try:
+                self.flush(older_than=self.linger)
+            except Exception as exc:
+                logger.error(
+                    'Batch flushing exception %s: %s',
+                    type(exc).__name__, str(exc))
+
+    def _send(self, stream_name, records):
+        # The shared client is created on first use
+        client = self.client or session.firehose
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                response = client.put_record_batch(
+                    DeliveryStreamName=stream_name,
+                    Records=[{'Data': data} for data in records])
+                if self.on_send is not None:
+                    self.on_send(
+                        stream_name, len(records),
+                        time.perf_counter() - start)
+            except Exception as exc:
+                logger.error(
+                    'Failed to send %d record(s) to stream %s. %s: %s',
+                    len(records), stream_name, type(exc).__name__, str(exc))
+                return self._failed(stream_name, records)
+            if response['FailedPutCount'] == 0:
+                logger.debug(
+                    'Pushed %d record(s) to stream %s.',
+                    len(records), stream_name)
+                return []
+            records = [
+                data for data, result in zip(
+                    records, response['RequestResponses'])
+                if 'ErrorCode' in result]
+            attempt += 1
+            if attempt > self.max_retries:
+                logger.error(
+                    'Giving up on %d record(s) for stream %s '
+                    'after %d retries.', len(records), stream_name,
+                    self.max_retries)
+                return self._failed(stream_name, records)
+            logger.warning(
+                '%d record(s) failed for stream %s. Retrying...',
+                len(records), stream_name)
+            time.sleep(0.1 * 2 ** attempt)
+
+    def _failed(self, stream_name, records):
+        if self.on_failure is not None:
+            try:
+                self.on_failure(stream_name, records)
+            except Exception as exc:
+                logger.error(
+                    'Lost %d record(s) for stream %s. %s: %s',
+                    len(records), stream_name, type(exc).__name__, str(exc))
+        return records
@@ -0,0 +1,138 @@
+"""
+Geo enrichment stage, with a cache of decoded locations.
+
+User locations repeat a lot ("London", "USA"), so each distinct
+location is decoded once and kept in an LRU cache shared by the
+invocations of a warm container.
+
+The geocoder is loaded on first use, from the memory-mapped index
+built with the Lambda layer (see `geoindex`), so containers of
+projects without geo extraction never load it.
+"""
+
+import os
+import logging
+import threading
+import importlib.util
+import unicodedata
+from copy import deepcopy
+from collections import OrderedDict
+
+from .env import LEnv
+from .geoindex import GeocodeIndex, INDEX_FILENAME
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+
+def load_geocode(path=LEnv.GEOCODE_INDEX_PATH):
+    """Returns the indexed geocoder, or loads `Geocode` without index.
+
+    The index is at `path`, or if it is empty in the data of the
+    geocode package.
+    """
+    if not path:
+        spec = importlib.util.find_spec('geocode')
+        if spec is not None:
+            path = os.path.join(
+                spec.submodule_search_locations[0], 'data', INDEX_FILENAME)
+    if path and os.path.isfile(path):
+        logger.info('Using geocode index %s.', path)
+        return GeocodeIndex(path)
+    logger.warning('No geocode index, loading Geocode.')
+    from geocode.geocode import Geocode
+    geo_code = Geocode()
+    geo_code.load()
+    return geo_code
+
+
+def normalize_location(location):
+    location = unicodedata.normalize('NFC', location)
+    return ' '.join(location.lower().split())
+
+
+class CachedGeocode():
+    """Geocoder with an LRU cache, keyed by normalized location.
+
+    Has the `decode` method of `Geocode`, so it can be given to
+    `ProcessTweet` in its place. The geocoder is loaded by `load` on
+    the first lookup.
+    """
+    def __init__(self, load=load_geocode, max_items=LEnv.GEO_CACHE_SIZE):
+        self.load = load
+        self.max_items = max_items
+        self._geo_code = None
+        self._load_lock = threading.Lock()
+        # Lookups served from and missing the cache, and locations
+        # decoded by the geocoder (misses and prefetched locations)
+        self.hits = 0
+        self.misses = 0
+        self.decodes = 0
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+
+    def decode(self, location):
+        if not isinstance(location, str) or not location.strip():
+            return self.geo_code.decode(location)
+        key = normalize_location(location)
+        with self._lock:
+            if key in self._items:
+                self.hits += 1
+                self._items.move_to_end(key)
+                # Callers may modify the result
+                return deepcopy(self._items[key])
+            self.misses += 1
+            self.decodes += 1
+        result = self.geo_code.decode(key)
+        self._remember({key: result})
+        return deepcopy(result)
+
+    def decode_many(self, locations):
+        """Decodes the distinct locations not cached yet, at once.
+
+        Meant to be called once per chunk, before the tweets are
+        extracted one by one.
+        """
+        keys = {
+            normalize_location(location) for location in locations
+            if isinstance(location, str) and location.strip()}
+        with self._lock:
+            keys = [key for key in keys if key not in self._items]
+            self.decodes += len(keys)
+        self._remember({key: self.geo_code.decode(key) for key in keys})
+
+    @property
+    def geo_code(self):
+        if self._geo_code is None:
+            with self._load_lock:
+                if self._geo_code is None:
+                    self._geo_code = self.load()
+        return self._geo_code
+
+    @property
+    def loaded(self):
+        return self._geo_code is not None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits, 'misses': self.misses,
+                'decodes': self.decodes, 'size': len(self._items)}
+
+    def _remember(self, items):
+        with self._lock:
+            for key, result in items.items():
+                self._items[key] = result
+                self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def __getattr__(self, name):
+        # Anything else is served by the geocoder
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.geo_code, name)
+
+
+def user_location(status):
+    return (status.get('user') or {}).get('location')
@@ -0,0 +1,206 @@
+"""
+Memory-mapped index of the `local-geocode` gazetteer.
+
+`Geocode.load()` unpickles a keyword trie and the place list into
+Python objects, which takes seconds on every Lambda cold start. The
+index holds the same data in one binary file: sorted (lowercased)
+names with the position of their place, and the places as JSON rows.
+It is opened with mmap, so only the pages that lookups touch are read.
+
+Layout (little endian): header `MAGIC, n_keys, n_rows`, key offsets
+(n_keys + 1 u64), key rows (n_keys u32), row offsets (n_rows + 1 u64),
+key bytes, row bytes.
+"""
+
+import os
+import sys
+import json
+import mmap
+import glob
+import pickle
+import string
+import struct
+import hashlib
+import logging
+import threading
+
+from . import jsoncodec
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+MAGIC = b'GEOIDX01'
+HEADER = struct.Struct('<8sII')
+INDEX_FILENAME = 'geonames.idx'
+
+# As in geocode.geocode.Geocode
+FIELD_NAMES = [
+    'name', 'official_name', 'country_code', 'longitude', 'latitude',
+    'geoname_id', 'location_type', 'population']
+DEFAULT_ARGUMENTS = ['30000', '200000'] + [
+    'city', 'place', 'country', 'admin1', 'admin2', 'admin3', 'admin4',
+    'admin5', 'admin6', 'admin_other', 'continent', 'region']
+# As in flashtext.KeywordProcessor, other characters separate words
+WORD_CHARS = frozenset(string.digits + string.ascii_letters + '_')
+
+
+def build_index(geo_data, path):
+    """Writes the index of the places of a `Geocode` pickle.
+
+    Place names are matched case-insensitively, like the keyword
+    processor `Geocode` builds from the same list.
+    """
+    keys = {}
+    for i, row in enumerate(geo_data):
+        keys[row[0].lower().encode('utf-8', 'surrogatepass')] = i
+    keys = sorted(keys.items())
+    # Not jsoncodec: missing country codes are NaN, as in the pickle
+    rows = [json.dumps(list(row)).encode() for row in geo_data]
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(keys), len(rows)))
+        f.write(_pack_offsets(key for key, _ in keys))
+        f.write(struct.pack(f'<{len(keys)}I', *(i for _, i in keys)))
+        f.write(_pack_offsets(rows))
+        for key, _ in keys:
+            f.write(key)
+        for row in rows:
+            f.write(row)
+    os.replace(tmp_path, path)
+    logger.info(
+        'Wrote geocode index of %d names, %d places to %s.',
+        len(keys), len(rows), path)
+    return path
+
+
+def build_geocode_index(data_dir):
+    """Indexes the pickle of the default `Geocode` in `data_dir`.
+
+    Returns the path of the index. Raises FileNotFoundError if there is
+    no pickle of the default arguments, e.g. after an update of
+    `local-geocode` changed them, rather than ship a layer without
+    index.
+    """
+    arguments_hash = hashlib.sha256(
+        ','.join(DEFAULT_ARGUMENTS).encode()).hexdigest()[:15]
+    pickle_path = os.path.join(data_dir, f'geonames_{arguments_hash}.pkl')
+    if not os.path.isfile(pickle_path):
+        raise FileNotFoundError(
+            f'No geonames pickle {os.path.basename(pickle_path)} in '
+            f'{data_dir}, found {glob.glob(os.path.join(data_dir, "*.pkl"))}.')
+    with open(pickle_path, 'rb') as f:
+        geo_data = pickle.load(f)
+    return build_index(geo_data, os.path.join(data_dir, INDEX_FILENAME))
+
+
+class GeocodeIndex():
+    """Decodes locations like `Geocode.decode`, from an index file.
+
+    The file is mapped on first use.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._mm = None
+
+    def decode(self, input_text):
+        if not input_text:
+            return []
+        self._open()
+        text = input_text.lower()
+        matches = set()
+        start = 0
+        while start < len(text):
+            match, end = self._longest_match(text, start)
+            if match is not None:
+                matches.add(match)
+                start = end
+            # Next word starts after a separator
+            while start < len(text) and text[start] in WORD_CHARS:
+                start += 1
+            start += 1
+        return [
+            dict(zip(FIELD_NAMES, self._row(i))) for i in sorted(matches)]
+
+    def close(self):
+        with self._lock:
+            if self._mm is not None:
+                self._key_offsets.release()
+                self._key_rows.release()
+                self._row_offsets.release()
+                self._mm.close()
+                self._mm = None
+
+    def _open(self):
+        if self._mm is not None:
+            return
+        with self._lock:
+            if self._mm is not None:
+                return
+            with open(self.path, 'rb') as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, n_keys, n_rows = HEADER.unpack_from(mm)
+            if magic != MAGIC or sys.byteorder != 'little':
+                mm.close()
+                raise ValueError(f'{self.path} is not a geocode index.')
+            # Views on the mapped tables, read page by page on access
+            view = memoryview(mm)
+            pos = HEADER.size
+            self._key_offsets = view[pos:pos + 8 * (n_keys + 1)].cast('Q')
+            pos += 8 * (n_keys + 1)
+            self._key_rows = view[pos:pos + 4 * n_keys].cast('I')
+            pos += 4 * n_keys
+            self._row_offsets = view[pos:pos + 8 * (n_rows + 1)].cast('Q')
+            pos += 8 * (n_rows + 1)
+            view.release()
+            self.n_keys = n_keys
+            self._keys = pos
+            self._rows = pos + self._key_offsets[n_keys]
+            self._mm = mm
+
+    def _longest_match(self, text, start):
+        """Returns the row of the longest name at start, and its end.
+
+        Names end before a separator or at the end of the text. The
+        range of names with the text as prefix narrows as it grows.
+        """
+        match = None, start
+        lo, hi = 0, self.n_keys
+        for end in range(start + 1, len(text) + 1):
+            prefix = text[start:end].encode('utf-8', 'surrogatepass')
+            lo = self._bisect(prefix, lo, hi)
+            # No UTF-8 byte is 0xff, so all names with the prefix are below
+            hi = self._bisect(prefix + b'\xff', lo, hi)
+            if lo == hi:
+                break
+            if self._key(lo) == prefix and (
+                    end == len(text) or text[end] not in WORD_CHARS):
+                match = self._key_rows[lo], end
+        return match
+
+    def _bisect(self, key, lo, hi):
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _key(self, i):
+        return self._mm[
+            self._keys + self._key_offsets[i]:
+            self._keys + self._key_offsets[i + 1]]
+
+    def _row(self, i):
+        return jsoncodec.loads(self._mm[
+            self._rows + self._row_offsets[i]:
+            self._rows + self._row_offsets[i + 1]])
+
+
+def _pack_offsets(items):
+    offsets = [0]
+    for item in items:
+        offsets.append(offsets[-1] + len(item))
+    return struct.pack(f'<{len(offsets)}Q', *offsets)
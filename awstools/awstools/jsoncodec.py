@@ -0,0 +1,69 @@
+"""
+JSON encoding and decoding for the hot paths.
+
+Uses orjson when it is installed and falls back to the standard library
+otherwise. Both write compact UTF-8 JSON that decodes to the same
+values: NaN and infinities become null, as orjson writes them. Only the
+formatting of floats differs (orjson writes 1e16 and 1e-7, the standard
+library 1e+16 and 1e-07).
+"""
+
+import json
+import math
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(data):
+    """Decodes a JSON document from str or bytes."""
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # E.g. lone surrogates, which the standard library accepts
+            pass
+    return json.loads(data)
+
+
+def dumps(obj):
+    """Encodes obj as compact JSON, returns bytes."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            # E.g. non-str keys or lone surrogates
+            pass
+    try:
+        return _dumps(obj)
+    except ValueError:
+        # Non-finite floats, which are not valid JSON
+        return _dumps(_finite(obj))
+
+
+def _dumps(obj):
+    try:
+        return json.dumps(
+            obj, separators=(',', ':'), ensure_ascii=False,
+            allow_nan=False).encode('utf-8')
+    except UnicodeEncodeError:
+        return json.dumps(
+            obj, separators=(',', ':'), allow_nan=False).encode('utf-8')
+
+
+def _finite(obj):
+    """Returns obj with NaN and infinities replaced by None."""
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {key: _finite(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_finite(value) for value in obj]
+    return obj
+
+
+def dumps_line(obj):
+    """Encodes obj as a line of newline delimited JSON."""
+    return dumps(obj) + b'\n'
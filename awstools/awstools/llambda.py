@@ -8,9 +8,10 @@ import subprocess
 import sys
 import os
 
-from .env import LEnv, ESEnv
-from .session import s3, iam, aws_lambda
+from .env import LEnv, ESEnv, SMEnv
+from . import session
 from .firehose import get_bucket_arn
+from .geoindex import build_geocode_index
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
@@ -34,6 +35,10 @@ def zip_lambda_layer(lambda_dir):
         'pip', 'install',
         '-r', os.path.join(base_name, 'requirements.txt'),
         '-t', os.path.join(base_name, 'python')])
+    # Precompiled geocode data, memory-mapped instead of unpickled
+    geocode_data_dir = os.path.join(base_name, 'python', 'geocode', 'data')
+    if os.path.isdir(geocode_data_dir):
+        build_geocode_index(geocode_data_dir)
     # https://stackoverflow.com/a/25650295/4949133
     # https://docs.python.org/3/library/shutil.html#archiving-example-with-base-dir
     shutil.make_archive(
@@ -78,6 +83,8 @@ def get_policy_name_arn(lambda_name):
 def prepare_policy(policy_path, function_name):
     with open(policy_path, 'r') as f:
         policy = f.read()
+        policy = policy.replace(
+            'PREDICTION_CACHE_TABLE', SMEnv.PREDICTION_CACHE_TABLE)
         policy = policy.replace('ACCOUNT_NUM', LEnv.ACCOUNT_NUM)
         policy = policy.replace('BUCKET_NAME', LEnv.BUCKET_NAME)
         policy = policy.replace('REGION', LEnv.REGION)
@@ -103,7 +110,7 @@ def create_lambda_role(lambda_name, policy_path):
 
     # Create a role
     try:
-        response = iam.create_role(
+        response = session.iam.create_role(
             RoleName=role_name,
             AssumeRolePolicyDocument=role_trust_relationship,
             Description=f'Role automatically created for Lambda '
@@ -120,7 +127,7 @@ def create_lambda_role(lambda_name, policy_path):
         logger.info(
             'Created role %s with ID %s for Lambda.',
             response['Role']['RoleName'], response['Role']['RoleId'])
-    except iam.exceptions.EntityAlreadyExistsException:
+    except session.iam.exceptions.EntityAlreadyExistsException:
         pass
 
     # Prepare the policy (fill in missing info)
@@ -128,7 +135,7 @@ def create_lambda_role(lambda_name, policy_path):
 
     # Create a policy
     try:
-        response = iam.create_policy(
+        response = session.iam.create_policy(
             PolicyName=policy_name,
             PolicyDocument=policy,
             Description=f'Policy automatically created for Lambda '
@@ -139,11 +146,11 @@ def create_lambda_role(lambda_name, policy_path):
         logger.info(
             'Created policy %s with ID %s for Lambda.',
             response['Policy']['PolicyName'], response['Policy']['PolicyId'])
-    except iam.exceptions.EntityAlreadyExistsException:
+    except session.iam.exceptions.EntityAlreadyExistsException:
         pass
 
     # Attach the policy to the role
-    response = iam.attach_role_policy(
+    response = session.iam.attach_role_policy(
         PolicyArn=policy_arn,
         RoleName=role_name
     )
@@ -159,12 +166,12 @@ def create_lambda_role(lambda_name, policy_path):
 def check_s3_diff(bucket, key, local_path=None):
     s3_obj = None
     try:
-        response = s3.get_object(
+        response = session.s3.get_object(
             Bucket=bucket,
             Key=key
         )
         s3_obj = response['Body'].read()
-    except s3.exceptions.NoSuchKey:
+    except session.s3.exceptions.NoSuchKey:
         return None, None
 
     s3_obj_hash = hashlib.sha256(s3_obj).digest()
@@ -191,7 +198,7 @@ def create_lambda_layer(
         s3_diff, _ = check_s3_diff(
             LEnv.BUCKET_NAME, layer_key, layer_local_zip_path)
         if not s3_diff:
-            s3.upload_file(
+            session.s3.upload_file(
                 layer_local_zip_path, LEnv.BUCKET_NAME, layer_key)
             logger.info('Layer %s pushed to S3.', layer_name)
         else:
@@ -201,7 +208,7 @@ def create_lambda_layer(
                 layer_name)
 
         if push_to_s3 and not s3_diff:
-            response = aws_lambda.publish_layer_version(
+            response = session.aws_lambda.publish_layer_version(
                 LayerName=layer_name,
                 Description=f'Automatically created for {LEnv.APP_NAME}',
                 Content={
@@ -238,7 +245,7 @@ def create_s3_to_es_lambda(
         hash_match, _ = check_s3_diff(
             LEnv.BUCKET_NAME, lambda_key, lambda_local_zip_path)
         if not hash_match:
-            s3.upload_file(
+            session.s3.upload_file(
                 lambda_local_zip_path, LEnv.BUCKET_NAME, lambda_key)
             logger.info('Function %s pushed to S3.', function_name)
         else:
@@ -253,7 +260,7 @@ def create_s3_to_es_lambda(
     time.sleep(10)
 
     try:
-        response = aws_lambda.list_layer_versions(
+        response = session.aws_lambda.list_layer_versions(
             CompatibleRuntime='python3.8',
             LayerName=layer_name
         )
@@ -262,7 +269,7 @@ def create_s3_to_es_lambda(
             version['Version'] for version in response['LayerVersions']]
 
         latest_version = max(versions)
-    except aws_lambda.exceptions.ResourceNotFoundException as exc:
+    except session.aws_lambda.exceptions.ResourceNotFoundException as exc:
         raise Exception(
             f'Layer {layer_name} does not exist. '
             "Use 'push_to_s3=True' or 'create_layer=True' "
@@ -270,16 +277,16 @@ def create_s3_to_es_lambda(
         ) from exc
 
     try:
-        response = aws_lambda.get_function(
+        response = session.aws_lambda.get_function(
             FunctionName=function_name)
-    except aws_lambda.exceptions.ResourceNotFoundException:
+    except session.aws_lambda.exceptions.ResourceNotFoundException:
         response = None
         count = 0
         while response is None:
             if count > 6:
                 raise TimeoutError
             try:
-                response = aws_lambda.create_function(
+                response = session.aws_lambda.create_function(
                     FunctionName=function_name,
                     Runtime='python3.8',
                     Role=role_arn,
@@ -308,13 +315,14 @@ def create_s3_to_es_lambda(
                         layer_arn + f':{latest_version}',
                     ]
                 )
-            except aws_lambda.exceptions.InvalidParameterValueException as exc:
+            except session.aws_lambda.exceptions \
+                    .InvalidParameterValueException as exc:
                 logger.warning('%s: %s', type(exc).__name__, str(exc))
                 count += 1
                 time.sleep(60)
 
         # Wait until lambda is active
-        response = aws_lambda.get_function(FunctionName=function_name)
+        response = session.aws_lambda.get_function(FunctionName=function_name)
         status = response['Configuration']['State']
         start = time.time()
         while status != 'Active':
@@ -324,7 +332,8 @@ def create_s3_to_es_lambda(
                     'Might be a problem with activation of lambda %s. '
                     'Please check the AWS console.', function_name)
                 break
-            response = aws_lambda.get_function(FunctionName=function_name)
+            response = session.aws_lambda.get_function(
+                FunctionName=function_name)
             status = response['Configuration']['State']
             logger.info(
                 'Waiting for lambda %s to become active.',
@@ -352,7 +361,7 @@ def create_s3_to_es_lambda(
 
     if aws_lambda_hash != s3_lambda_hash_b64:
         # Publish a new version if the code on S3 got updated
-        _ = aws_lambda.update_function_code(
+        _ = session.aws_lambda.update_function_code(
             FunctionName=function_name,
             S3Bucket=LEnv.BUCKET_NAME,
             S3Key=lambda_key,
@@ -370,7 +379,7 @@ def create_s3_to_es_lambda(
         int(response['Configuration']['Layers'][0]['Arn'].split(':')[-1])
 
     if aws_layer_version_num < latest_version:
-        _ = aws_lambda.update_function_configuration(
+        _ = session.aws_lambda.update_function_configuration(
             FunctionName=function_name,
             Layers=[
                 layer_arn + f':{latest_version}',
@@ -387,18 +396,18 @@ def create_s3_to_es_lambda(
     if s3_trigger:
         # Add permission to invoke from S3
         try:
-            _ = aws_lambda.add_permission(
+            _ = session.aws_lambda.add_permission(
                 FunctionName=function_name,
                 StatementId='1',
                 Action='lambda:InvokeFunction',
                 Principal='s3.amazonaws.com',
                 SourceArn=get_bucket_arn(LEnv.BUCKET_NAME)
             )
-        except aws_lambda.exceptions.ResourceConflictException:
+        except session.aws_lambda.exceptions.ResourceConflictException:
             pass
 
         # Get the current notification config
-        notification_config = s3.get_bucket_notification_configuration(
+        notification_config = session.s3.get_bucket_notification_configuration(
             Bucket=LEnv.BUCKET_NAME
         )
 
@@ -456,14 +465,15 @@ def create_s3_to_es_lambda(
             # print('New lambda config')
             # print(notification_config['LambdaFunctionConfigurations'])
 
-            _ = s3.put_bucket_notification_configuration(
+            _ = session.s3.put_bucket_notification_configuration(
                 Bucket=LEnv.BUCKET_NAME,
                 NotificationConfiguration=notification_config
             )
 
-            notification_config = s3.get_bucket_notification_configuration(
-                Bucket=LEnv.BUCKET_NAME
-            )
+            notification_config = \
+                session.s3.get_bucket_notification_configuration(
+                    Bucket=LEnv.BUCKET_NAME
+                )
 
             notification_config = {
                 k: v for k, v in notification_config.items()
@@ -0,0 +1,395 @@
+"""
+From S3 objects of tweets to Elasticsearch documents.
+
+Objects are read with S3 Select and their tweets are decoded,
+predicted, extracted (with geo enrichment) and bulk indexed in chunks,
+so memory does not grow with the object size. Used by lambda-s3-to-es
+and by the backfill command; needs `twiprocess` (awstools[pipeline]).
+"""
+
+import os
+import json
+import queue
+import logging
+import threading
+from copy import deepcopy
+from itertools import islice
+from collections import Counter
+
+from . import jsoncodec
+from .env import ESEnv, SMEnv, LEnv
+from .config import get_config_manager
+from .cache import document_cache, DocumentCache
+from .elasticsearch import BulkIndexer
+from .geo import CachedGeocode, user_location
+from .prediction_cache import prediction_cache_from_env
+from .s3 import iter_s3_object_lines
+from .sagemaker import InferenceScheduler
+
+logger = logging.getLogger(__name__)
+# Chunks of statuses are dumped at DEBUG level
+logger.setLevel(logging.INFO)
+
+DEFAULT_STANDARDIZE_FUNC_NAME = 'standardize_anonymize'
+INPUT_SERIALIZATION = {'CompressionType': 'GZIP', 'JSON': {'Type': 'LINES'}}
+
+
+def get_slug(key):
+    slug = [
+        name for name in key.split('/')
+        if name.startswith(ESEnv.INDEX_PREFIX)
+    ]
+    if len(slug) != 1:
+        logger.error('Slug len != 1.\nKey: %s.\nSlug: %s.', key, slug)
+    return slug[0][len(ESEnv.INDEX_PREFIX):]
+
+
+def get_batch_size(model_type):
+    if model_type == 'fasttext':
+        return SMEnv.BATCH_SIZE_FASTTEXT
+    logger.warning(
+        'Model type %s unknown. Using default batch size.', model_type)
+    return SMEnv.BATCH_SIZE_DEFAULT
+
+
+def labels_to_int(labels):
+    """Heuristic to convert label to numeric value.
+    Parses leading numbers in label tags such as 1_worried -> 1.
+    If any conversion fails, returns None.
+    """
+    label_vals = []
+    for label in labels:
+        if label == 'positive':
+            label_vals.append(1)
+        elif label == 'negative':
+            label_vals.append(-1)
+        elif label == 'neutral':
+            label_vals.append(0)
+        else:
+            label_split = label.split('_')
+            try:
+                label_val = int(label_split[0])
+            except ValueError:
+                return
+            label_vals.append(label_val)
+    return label_vals
+
+
+def preprocess(preprocessing_config, texts):
+    import twiprocess as twp
+
+    # Preprocess data
+    preprocessing_config = dict(preprocessing_config)
+    try:
+        standardize_func_name = preprocessing_config['standardize_func_name']
+        del preprocessing_config['standardize_func_name']
+    except KeyError:
+        standardize_func_name = DEFAULT_STANDARDIZE_FUNC_NAME
+    if standardize_func_name is not None:
+        logger.debug('Standardizing data...')
+        standardize_func = getattr(
+            __import__(
+                'twiprocess.standardize',
+                fromlist=[standardize_func_name]),
+            standardize_func_name)
+        texts = [standardize_func(text) for text in texts]
+    if preprocessing_config != {}:
+        logger.debug('Preprocessing data...')
+        texts = [
+            twp.preprocess(text, **preprocessing_config) for text in texts]
+    return texts
+
+
+def add_label_vals(outputs):
+    """Adds numeric label values, if all labels can be converted."""
+    label_valss = [
+        labels_to_int(output['labels']) for output in outputs
+        if output is not None]
+    if not all(label_valss):
+        return outputs
+    label_valss = iter(label_valss)
+    return [
+        output if output is None else
+        {'label_vals': next(label_valss), **output}
+        for output in outputs]
+
+
+def predictions_from_output(output, primary=False):
+    max_prob = max(output['probabilities'])
+    ind_max_prob = output['probabilities'].index(max_prob)
+    prefix = 'primary_' if primary else ''
+    return {
+        f'{prefix}probability': max_prob,
+        f'{prefix}label': output['labels'][ind_max_prob],
+        f'{prefix}label_val': output['label_vals'][ind_max_prob]
+        if 'label_vals' in output else None
+    }
+
+
+def iter_chunks(iterable, size):
+    """Yields lists of up to `size` items."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_ahead(iterable, size):
+    """Yields the items of iterable, read up to `size` items ahead by a
+    thread. Exceptions of the iterable are raised in the caller.
+    """
+    items = queue.Queue(maxsize=size)
+    stopped = threading.Event()
+    end = object()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def read():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+            put((end, None))
+        except Exception as exc:
+            put((end, exc))
+
+    thread = threading.Thread(target=read)
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            item, exc = items.get()
+            if exc is not None:
+                raise exc
+            if item is end:
+                return
+            yield item
+    finally:
+        # Lets the thread finish if the caller stops early
+        stopped.set()
+
+
+class Project():
+    """Endpoints and index of a project, shared by its objects.
+
+    Indexes into `index_name`, by default the latest index of the
+    project.
+    """
+    def __init__(
+        self, slug, scheduler, config_manager=None, documents=None,
+        index_name=None
+    ):
+        self.slug = slug
+        self.scheduler = scheduler
+        documents = documents or document_cache
+        # Get model endpoints from config
+        conf = (config_manager or get_config_manager()).get_conf_by_slug(
+            slug)
+        self.model_endpoints = conf.model_endpoints or {}
+        self.extract_geo = conf.extract_geo
+
+        # Read off stream config and prepare a template for metadata
+        self.prediction = {}
+        self.endpoint_names = {}
+        self.run_names = {}
+        self.model_types = {}
+        self.preprocessing_configs = {}
+        for question_tag in self.model_endpoints:
+            self.endpoint_names[question_tag] = []
+            self.run_names[question_tag] = []
+            self.model_types[question_tag] = []
+            self.prediction[question_tag] = {'endpoints': {}}
+            self.preprocessing_configs[question_tag] = []
+            for endpoint_name, info in \
+                    self.model_endpoints[question_tag]['active'].items():
+                self.endpoint_names[question_tag].append(endpoint_name)
+                self.run_names[question_tag].append(info['run_name'])
+                self.model_types[question_tag].append(info['model_type'])
+
+                key = os.path.join(
+                    ESEnv.ENDPOINTS_PREFIX, endpoint_name + '.json')
+                logger.debug(f'Key: {key}')
+
+                try:
+                    logger.debug('Trying to load from S3')
+                    run_config = documents.get(ESEnv.BUCKET_NAME, key)
+                except Exception:
+                    logger.debug('Some error, addind an empty config')
+                    run_config = {'preprocess': {}}
+
+                self.preprocessing_configs[question_tag].append(
+                    run_config['preprocess'])
+        logger.info('Endpoint names:\n%s.', self.endpoint_names)
+
+        if index_name is None:
+            indices = documents.get(ESEnv.BUCKET_NAME, ESEnv.CONFIG_S3_KEY)
+            index_name = indices[slug][-1]
+        self.index_name = index_name
+        logger.debug(self.index_name)
+
+    def submit(self, endpoint_name, preprocessing_config, texts, batch_size):
+        """Schedules prediction in batches, returns an InferenceJob.
+
+        Retweets repeat the same texts: each distinct text is
+        preprocessed once and the scheduler sends each distinct input
+        once.
+        """
+        unique_texts = list(dict.fromkeys(texts))
+        preprocessed = dict(zip(
+            unique_texts, preprocess(preprocessing_config, unique_texts)))
+        return self.scheduler.submit(
+            endpoint_name, [preprocessed[text] for text in texts],
+            batch_size, preprocessing_config=preprocessing_config)
+
+    def predict(self, texts):
+        """Returns the predictions of all endpoints, per text."""
+        predictions = [deepcopy(self.prediction) for _ in texts]
+
+        # Run all endpoints and batches at once
+        jobs = {}
+        for question_tag in self.endpoint_names:
+            for endpoint_name, model_type, preprocessing_config in zip(
+                self.endpoint_names[question_tag],
+                self.model_types[question_tag],
+                self.preprocessing_configs[question_tag]
+            ):
+                jobs[question_tag, endpoint_name] = self.submit(
+                    endpoint_name, preprocessing_config, texts,
+                    get_batch_size(model_type))
+
+        # Fill metadata with predictions
+        for question_tag in self.endpoint_names:
+            primary_endpoint_name = \
+                self.model_endpoints[question_tag]['primary']
+            for endpoint_name, run_name in zip(
+                self.endpoint_names[question_tag],
+                self.run_names[question_tag]
+            ):
+                outputs = add_label_vals(
+                    jobs[question_tag, endpoint_name].result())
+
+                if endpoint_name == primary_endpoint_name:
+                    for i, output in enumerate(outputs):
+                        if output is not None:
+                            predictions[i][question_tag]['endpoints'] = \
+                                predictions_from_output(output, primary=True)
+
+                for i, output in enumerate(outputs):
+                    if output is not None:
+                        predictions[i][question_tag]['endpoints'][run_name] = \
+                            predictions_from_output(output)
+        return predictions
+
+
+class Pipeline():
+    """Indexes S3 objects of tweets, in chunks of `chunk_size` tweets.
+
+    The prediction scheduler, bulk indexer and geocoder are shared by
+    all projects and by the threads running the pipeline. Local
+    stand-ins can be given for S3 (`s3_client`) and Elasticsearch
+    (through `indexer`). Up to `prefetch_chunks` chunks are read ahead
+    while a chunk is processed.
+    """
+    def __init__(
+        self, scheduler=None, indexer=None, geo_code=None, s3_client=None,
+        config_manager=None, chunk_size=LEnv.CHUNK_SIZE,
+        prefetch_chunks=LEnv.PREFETCH_CHUNKS
+    ):
+        self.scheduler = scheduler or InferenceScheduler(
+            cache=prediction_cache_from_env())
+        self.indexer = indexer or BulkIndexer()
+        self.geo_code = geo_code or CachedGeocode()
+        self.s3_client = s3_client
+        self.config_manager = config_manager
+        self.chunk_size = chunk_size
+        self.prefetch_chunks = prefetch_chunks
+        self.documents = document_cache if s3_client is None else \
+            DocumentCache(s3_client=s3_client)
+
+    def project(self, slug, index_name=None):
+        return Project(
+            slug, self.scheduler, self.config_manager, self.documents,
+            index_name)
+
+    def iter_statuses(self, bucket, key):
+        """Yields the decoded statuses of an S3 object as they arrive."""
+        for line in iter_s3_object_lines(
+                bucket, key, INPUT_SERIALIZATION, self.s3_client):
+            try:
+                yield jsoncodec.loads(line)
+            except json.JSONDecodeError as exc:
+                logger.error('%s: %s', type(exc).__name__, str(exc))
+                logger.error('Key: %s. Line:\n%s', key, line)
+
+    def process_chunk(self, statuses, project):
+        """Returns the ES documents of statuses, with their predictions."""
+        from twiprocess.processtweet import ProcessTweet
+
+        texts = [status['text'] for status in statuses]
+        predictions = project.predict(texts)
+
+        # Process tweets for ES, decoding the locations of the chunk at once
+        geo_code = self.geo_code if project.extract_geo else None
+        if geo_code is not None:
+            geo_code.decode_many(
+                user_location(status) for status in statuses)
+        statuses_es = []
+        for status, prediction in zip(statuses, predictions):
+            status_es = ProcessTweet(
+                status, standardize_func='standardize', geo_code=geo_code
+            ).extract_es(extract_geo=project.extract_geo)
+            # This way, if prediction fails, we at least store the tweet
+            if prediction != project.prediction:
+                # Keep the failed predictions empty
+                status_es['predictions'] = prediction
+            statuses_es.append(status_es)
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(b'\n\n'.join(
+                [jsoncodec.dumps(status) for status in statuses]
+            ).decode('utf-8'))
+        return statuses_es
+
+    def index_object(self, bucket, key, project):
+        """Indexes the statuses of one S3 object, returns the results.
+
+        The S3 Select stream is read ahead by `prefetch_chunks` chunks,
+        so that it keeps flowing while a chunk is predicted and
+        indexed. When processing is slower than S3 for longer than
+        that, the stream idles and may be closed by S3; the query is
+        then resumed, from the start of the object for GZIP objects
+        (see iter_s3_object_lines), which rescans what was read.
+        """
+        results = Counter({result: 0 for result in BulkIndexer.RESULTS})
+        n_statuses = 0
+        chunks = iter_chunks(self.iter_statuses(bucket, key), self.chunk_size)
+        if self.prefetch_chunks:
+            chunks = iter_ahead(chunks, self.prefetch_chunks)
+        try:
+            for statuses in chunks:
+                n_statuses += len(statuses)
+                statuses_es = self.process_chunk(statuses, project)
+                del statuses
+                # Load to Elasticsearch
+                results.update(self.indexer.create(project.index_name, (
+                    (status_es.pop('id'), status_es)
+                    for status_es in statuses_es)))
+        finally:
+            # Stops reading ahead on errors
+            chunks.close()
+
+        logger.info(
+            'Loaded %d/%d from %s to Elasticsearch, already exist %d, '
+            'mapping errors %d, failed %d.',
+            results['created'], n_statuses, key, results['exists'],
+            results['mapping_error'], results['failed'])
+        return results
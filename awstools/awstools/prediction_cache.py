@@ -0,0 +1,195 @@
+"""
+Content addressed cache of model predictions.
+
+Predictions are keyed by the endpoint, the preprocessing config and the
+normalized (preprocessed) text. An in-memory LRU tier serves warm Lambda
+containers, an optional store (SQLite file or DynamoDB table) is shared
+between containers and runs.
+"""
+
+import logging
+import json
+import time
+import random
+import hashlib
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+
+from . import jsoncodec
+from .env import SMEnv
+from .session import get_client
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+
+def prediction_key(endpoint_name, preprocessing_config, text):
+    config_hash = hashlib.sha256(json.dumps(
+        preprocessing_config or {}, sort_keys=True).encode()).hexdigest()
+    text = ' '.join(unicodedata.normalize('NFC', text).split())
+    text_hash = hashlib.sha256(text.encode()).hexdigest()
+    return f'{endpoint_name}:{config_hash[:16]}:{text_hash}'
+
+
+class PredictionCache():
+    """LRU tier in front of an optional shared store."""
+    def __init__(self, max_items=SMEnv.PREDICTION_CACHE_SIZE, store=None):
+        self.max_items = max_items
+        self.store = store
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+
+    def get_many(self, keys):
+        """Returns the cached predictions of keys, as a dict."""
+        hits = {}
+        with self._lock:
+            for key in keys:
+                if key in self._items:
+                    self._items.move_to_end(key)
+                    hits[key] = self._items[key]
+        missing = [key for key in keys if key not in hits]
+        if missing and self.store is not None:
+            try:
+                found = self.store.get_many(missing)
+            except Exception as exc:
+                logger.error(
+                    'Prediction store exception %s: %s',
+                    type(exc).__name__, str(exc))
+                found = {}
+            self._remember(found)
+            hits.update(found)
+        return hits
+
+    def put_many(self, items):
+        """Caches (key, prediction) pairs."""
+        items = dict(items)
+        self._remember(items)
+        if self.store is not None and items:
+            try:
+                self.store.put_many(items)
+            except Exception as exc:
+                logger.error(
+                    'Prediction store exception %s: %s',
+                    type(exc).__name__, str(exc))
+
+    def _remember(self, items):
+        with self._lock:
+            for key, prediction in items.items():
+                self._items[key] = prediction
+                self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+
+class SQLiteStore():
+    """Predictions in a local SQLite file."""
+    # Keys per SELECT
+    CHUNK_SIZE = 500
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS predictions '
+            '(key TEXT PRIMARY KEY, value BLOB)')
+        self._conn.commit()
+
+    def get_many(self, keys):
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), self.CHUNK_SIZE):
+                chunk = keys[i:i + self.CHUNK_SIZE]
+                rows = self._conn.execute(
+                    'SELECT key, value FROM predictions WHERE key IN '
+                    f'({",".join("?" * len(chunk))})', chunk)
+                for key, value in rows:
+                    found[key] = jsoncodec.loads(value)
+        return found
+
+    def put_many(self, items):
+        with self._lock:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO predictions VALUES (?, ?)',
+                [(key, jsoncodec.dumps(value))
+                 for key, value in items.items()])
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class DynamoDBStore():
+    """Predictions in a DynamoDB table with the string hash key `key`.
+
+    Unprocessed keys and items (throttling) are retried with
+    exponential backoff and full jitter, up to MAX_ATTEMPTS requests.
+    """
+    # Limits of BatchGetItem and BatchWriteItem
+    GET_CHUNK_SIZE = 100
+    PUT_CHUNK_SIZE = 25
+    MAX_ATTEMPTS = 5
+    # Seconds, doubled for each retry
+    BACKOFF = 0.05
+    MAX_BACKOFF = 1.
+
+    def __init__(self, table_name, client=None):
+        self.table_name = table_name
+        self.client = client
+
+    def get_many(self, keys):
+        client = self.client or get_client('dynamodb')
+        found = {}
+
+        def add_found(response):
+            for item in response['Responses'].get(self.table_name, []):
+                found[item['key']['S']] = jsoncodec.loads(item['value']['S'])
+
+        for i in range(0, len(keys), self.GET_CHUNK_SIZE):
+            request = {self.table_name: {
+                'Keys': [
+                    {'key': {'S': key}}
+                    for key in keys[i:i + self.GET_CHUNK_SIZE]],
+                'ProjectionExpression': '#k, #v',
+                'ExpressionAttributeNames': {'#k': 'key', '#v': 'value'}}}
+            self._batch(
+                client.batch_get_item, request, 'UnprocessedKeys', add_found)
+        return found
+
+    def put_many(self, items):
+        client = self.client or get_client('dynamodb')
+        items = list(items.items())
+        for i in range(0, len(items), self.PUT_CHUNK_SIZE):
+            request = {self.table_name: [
+                {'PutRequest': {'Item': {
+                    'key': {'S': key},
+                    'value': {'S': jsoncodec.dumps(value).decode()}}}}
+                for key, value in items[i:i + self.PUT_CHUNK_SIZE]]}
+            self._batch(client.batch_write_item, request, 'UnprocessedItems')
+
+    def _batch(self, send, request, unprocessed_name, on_response=None):
+        for attempt in range(self.MAX_ATTEMPTS):
+            if attempt:
+                time.sleep(random.uniform(
+                    0, min(self.BACKOFF * 2 ** attempt, self.MAX_BACKOFF)))
+            response = send(RequestItems=request)
+            if on_response is not None:
+                on_response(response)
+            request = response.get(unprocessed_name)
+            if not request:
+                return
+        logger.warning(
+            '%s of table %s left after %d attempts.',
+            unprocessed_name, self.table_name, self.MAX_ATTEMPTS)
+
+
+def prediction_cache_from_env():
+    """Builds the cache configured by the PREDICTION_CACHE_* variables."""
+    store = None
+    if SMEnv.PREDICTION_CACHE_STORE == 'sqlite':
+        store = SQLiteStore(SMEnv.PREDICTION_CACHE_PATH)
+    elif SMEnv.PREDICTION_CACHE_STORE == 'dynamodb':
+        store = DynamoDBStore(SMEnv.PREDICTION_CACHE_TABLE)
+    return PredictionCache(SMEnv.PREDICTION_CACHE_SIZE, store)
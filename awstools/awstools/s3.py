@@ -1,49 +1,142 @@
 import logging
+import time
 
-from botocore.exceptions import ClientError
+from botocore.exceptions import BotoCoreError, ClientError
 
-from .session import s3
+from . import jsoncodec
+from .session import get_client
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
 
-def get_long_s3_object(bucket, key, input_serialization, s3_client=s3):
-    # Get S3 object
-    records = b''
-    repeat = True
-    while repeat:
+# Uncompressed objects are queried in ranges of this size
+SELECT_SCAN_RANGE_BYTES = 32 * 1024 ** 2
+# Error codes of S3 Select worth retrying
+SELECT_RETRY_CODES = {
+    'InternalError', 'ServiceUnavailable', 'SlowDown', 'ThrottlingException',
+    'RequestTimeout'}
+
+
+class IncompleteSelectError(Exception):
+    """The S3 Select event stream ended without an End event."""
+
+
+def iter_s3_object_lines(
+    bucket, key, input_serialization, s3_client=None, max_retries=5,
+    decode=False
+):
+    """Yields the records of an S3 object as JSON lines (bytes).
+
+    Lines are yielded as the S3 Select payloads arrive, so only the
+    last incomplete line is buffered. Uncompressed JSON lines and CSV
+    objects are queried in scan ranges; an interrupted query is resumed
+    with the current range (or from the start for compressed objects),
+    skipping the lines already yielded. With `decode`, yields the
+    decoded records instead.
+    """
+    s3_client = s3_client or get_client('s3')
+    scan_ranges = [None]
+    if _supports_scan_range(input_serialization):
         try:
-            response = s3_client.select_object_content(
-                Bucket=bucket,
-                Key=key,
-                ExpressionType='SQL',
-                Expression="select * from s3object",
-                InputSerialization=input_serialization,
-                OutputSerialization={'JSON': {}}
-            )
+            size = s3_client.head_object(
+                Bucket=bucket, Key=key)['ContentLength']
         except ClientError as exc:
-            if exc.response['Error']['Code'] == 'NoSuchKey':
-                logger.error(
-                    '%s: %s Key: %s',
-                    exc.response['Error']['Code'],
-                    exc.response['Error']['Message'],
-                    key)
-                repeat = False
-                continue
-            else:
+            if exc.response['Error']['Code'] not in ['404', 'NoSuchKey']:
                 raise exc
+            logger.error('NoSuchKey: Key: %s', key)
+            return
+        scan_ranges = [
+            {'Start': start,
+             'End': min(start + SELECT_SCAN_RANGE_BYTES, size) - 1}
+            for start in range(0, size, SELECT_SCAN_RANGE_BYTES)]
+
+    for scan_range in scan_ranges:
+        n_yielded = 0
+        attempt = 0
+        while True:
+            skip = n_yielded
+            try:
+                for line in _select_lines(
+                        s3_client, bucket, key, input_serialization,
+                        scan_range):
+                    if skip:
+                        skip -= 1
+                        continue
+                    n_yielded += 1
+                    yield jsoncodec.loads(line) if decode else line
+                break
+            except ClientError as exc:
+                code = exc.response['Error']['Code']
+                if code == 'NoSuchKey':
+                    logger.error(
+                        '%s: %s Key: %s',
+                        code, exc.response['Error']['Message'], key)
+                    return
+                if code not in SELECT_RETRY_CODES or attempt >= max_retries:
+                    raise exc
+                error = exc
+            except (BotoCoreError, IncompleteSelectError) as exc:
+                if attempt >= max_retries:
+                    raise exc
+                error = exc
+            attempt += 1
+            logger.warning(
+                'S3 Select of %s interrupted %s: %s. Resuming after %d '
+                'line(s).', key, type(error).__name__, str(error), n_yielded)
+            time.sleep(min(2 ** attempt * .1, 5))
+
+
+def _select_lines(s3_client, bucket, key, input_serialization, scan_range):
+    params = {}
+    if scan_range is not None:
+        params['ScanRange'] = scan_range
+    response = s3_client.select_object_content(
+        Bucket=bucket,
+        Key=key,
+        ExpressionType='SQL',
+        Expression="select * from s3object",
+        InputSerialization=input_serialization,
+        OutputSerialization={'JSON': {}},
+        **params
+    )
+    tail = b''
+    for event in response['Payload']:
+        if 'Records' in event:
+            lines = (tail + event['Records']['Payload']).split(b'\n')
+            tail = lines.pop()
+            for line in lines:
+                yield line + b'\n'
+        if 'End' in event:
+            if tail:
+                yield tail
+            return
+    raise IncompleteSelectError(f'No End event for {key}.')
+
+
+def _supports_scan_range(input_serialization):
+    # Only uncompressed CSV and JSON lines can be queried in ranges
+    if input_serialization.get('CompressionType', 'NONE') != 'NONE':
+        return False
+    if 'CSV' in input_serialization:
+        return True
+    return input_serialization.get('JSON', {}).get('Type') == 'LINES'
+
+
+def get_long_s3_object(bucket, key, input_serialization, s3_client=None):
+    return b''.join(iter_s3_object_lines(
+        bucket, key, input_serialization, s3_client)).decode('utf-8')
 
-        for event in response['Payload']:
-            if 'End' in event:
-                repeat = False
-            if 'Records' in event:
-                records += event['Records']['Payload']
 
-    return records.decode('utf-8')
+def get_s3_object_etag(bucket, key, s3_client=None):
+    """Cheap check whether an object changed, without downloading it."""
+    s3_client = s3_client or get_client('s3')
+    response = s3_client.head_object(Bucket=bucket, Key=key)
+    return response['ETag']
 
 
-def get_s3_object(bucket, key, s3_client=s3, version_id=None):
+def get_s3_object(bucket, key, s3_client=None, version_id=None):
+    s3_client = s3_client or get_client('s3')
     params = {'Bucket': bucket, 'Key': key}
     if version_id:
         params['VersionId'] = version_id
@@ -0,0 +1,161 @@
+"""
+Concurrent inference on SageMaker endpoints.
+"""
+
+import logging
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from . import jsoncodec
+from .env import SMEnv
+from .session import get_client
+from .prediction_cache import prediction_key
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+
+class InferenceJob():
+    """Predictions for texts, run in batches on one endpoint."""
+    def __init__(self, endpoint_name, outputs, positions=None):
+        self.endpoint_name = endpoint_name
+        # Outputs known upfront (cached), None for texts to be predicted
+        self.outputs = outputs
+        # Position of each text among the texts sent, if deduplicated
+        self.positions = positions
+        # Futures and the positions of their texts
+        self.batches = []
+
+    def result(self):
+        """Returns one output per text, in input order.
+
+        Outputs are dicts with labels and probabilities, None for the
+        texts of batches that failed.
+        """
+        outputs = list(self.outputs)
+        for future, indices in self.batches:
+            try:
+                predictions = future.result()
+            except Exception as exc:
+                logger.error(
+                    'Batch of %d text(s) on %s failed %s: %s',
+                    len(indices), self.endpoint_name,
+                    type(exc).__name__, str(exc))
+                continue
+            for i, prediction in zip(indices, predictions):
+                outputs[i] = prediction
+        if self.positions is not None:
+            outputs = [outputs[i] for i in self.positions]
+        return outputs
+
+
+class InferenceScheduler():
+    """Fans batches out over a bounded thread pool.
+
+    At most `max_per_endpoint` batches run on one endpoint at a time,
+    further batches wait for their turn without holding a thread.
+    With a PredictionCache, cached texts are not sent at all.
+    """
+    def __init__(
+        self, max_workers=SMEnv.MAX_WORKERS,
+        max_per_endpoint=SMEnv.MAX_CONCURRENCY_PER_ENDPOINT,
+        client=None, cache=None
+    ):
+        self.max_per_endpoint = max_per_endpoint
+        self.client = client
+        self.cache = cache
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._lock = threading.RLock()
+        self._pending = defaultdict(deque)
+        self._running = defaultdict(int)
+
+    def submit(
+        self, endpoint_name, texts, batch_size, dedupe=True,
+        preprocessing_config=None
+    ):
+        """Schedules predictions for texts, returns an InferenceJob.
+
+        With `dedupe`, every distinct text is sent only once and its
+        output is given to all of its copies. `preprocessing_config`
+        is part of the cache key.
+        """
+        n_texts = len(texts)
+        positions = None
+        if dedupe:
+            unique = {}
+            positions = [
+                unique.setdefault(text, len(unique)) for text in texts]
+            texts = list(unique)
+        outputs = [None] * len(texts)
+        keys = None
+        todo = range(len(texts))
+        if self.cache is not None:
+            keys = [
+                prediction_key(endpoint_name, preprocessing_config, text)
+                for text in texts]
+            hits = self.cache.get_many(keys)
+            todo = []
+            for i, key in enumerate(keys):
+                if key in hits:
+                    outputs[i] = hits[key]
+                else:
+                    todo.append(i)
+        logger.debug(
+            '%d text(s) to predict out of %d for %s.',
+            len(todo), n_texts, endpoint_name)
+
+        job = InferenceJob(endpoint_name, outputs, positions)
+        for i in range(0, len(todo), batch_size):
+            indices = todo[i:i + batch_size]
+            future = Future()
+            job.batches.append((future, indices))
+            with self._lock:
+                self._pending[endpoint_name].append((
+                    future, [texts[j] for j in indices],
+                    None if keys is None else [keys[j] for j in indices]))
+        self._dispatch(endpoint_name)
+        return job
+
+    def predict(self, endpoint_name, texts, batch_size, **kwargs):
+        return self.submit(endpoint_name, texts, batch_size, **kwargs).result()
+
+    def _dispatch(self, endpoint_name):
+        with self._lock:
+            pending = self._pending[endpoint_name]
+            while pending and \
+                    self._running[endpoint_name] < self.max_per_endpoint:
+                future, batch, keys = pending.popleft()
+                self._running[endpoint_name] += 1
+                self._executor.submit(
+                    self._run, endpoint_name, future, batch, keys)
+
+    def _run(self, endpoint_name, future, batch, keys):
+        try:
+            predictions = self._invoke(endpoint_name, batch)
+            if keys is not None:
+                self.cache.put_many(zip(keys, predictions))
+            future.set_result(predictions)
+        except Exception as exc:
+            future.set_exception(exc)
+        finally:
+            with self._lock:
+                self._running[endpoint_name] -= 1
+            self._dispatch(endpoint_name)
+
+    def _invoke(self, endpoint_name, batch):
+        client = self.client or get_client('sagemaker-runtime')
+        response = client.invoke_endpoint(
+            EndpointName=endpoint_name,
+            Body=jsoncodec.dumps({'text': batch}),
+            ContentType='application/json'
+        )
+        predictions = jsoncodec.loads(response['Body'].read())['predictions']
+        if len(predictions) != len(batch):
+            raise ValueError(
+                f'Got {len(predictions)} predictions for '
+                f'{len(batch)} texts.')
+        return [{
+            'labels': pred['labels'],
+            'probabilities': pred['probabilities']
+        } for pred in predictions]
@@ -1,44 +1,102 @@
-import boto3
-from elasticsearch import Elasticsearch, RequestsHttpConnection
-from requests_aws4auth import AWS4Auth
+"""
+AWS and Elasticsearch clients.
+
+Clients are created on first access and cached, so that importing
+awstools does not pay for clients that are never used. The module
+attributes `session`, `s3`, `aws_lambda`, `iam`, `firehose`, `ecs`,
+`credentials`, `awsauth` and `es` are still available (PEP 562).
+"""
+import threading
 
 from .env import AWSEnv, ESEnv
 
-# https://forums.aws.amazon.com/thread.jspa?threadID=197439
-if AWSEnv.SESSION_TOKEN == -1:
-    # Launched from a server, no need for a session token
-    session = boto3.Session(
-        region_name=AWSEnv.REGION,
-        aws_access_key_id=AWSEnv.ACCESS_KEY_ID,
-        aws_secret_access_key=AWSEnv.SECRET_ACCESS_KEY
-    )
-else:
-    # Launched from a lambda, a session token is in the env
-    session = boto3.Session(
-        # region_name=AWSEnv.REGION,
-        # aws_access_key_id=AWSEnv.ACCESS_KEY_ID,
-        # aws_secret_access_key=AWSEnv.SECRET_ACCESS_KEY,
-        # aws_session_token=AWSEnv.SESSION_TOKEN
+_lock = threading.RLock()
+_session = None
+_clients = {}
+_es = None
+
+# Module attribute -> boto3 service name
+CLIENT_NAMES = {
+    's3': 's3',
+    'aws_lambda': 'lambda',
+    'iam': 'iam',
+    'firehose': 'firehose',
+    'ecs': 'ecs',
+    'sagemaker_runtime': 'sagemaker-runtime',
+}
+
+
+def get_session():
+    global _session
+    with _lock:
+        if _session is None:
+            import boto3
+            # https://forums.aws.amazon.com/thread.jspa?threadID=197439
+            if AWSEnv.SESSION_TOKEN == -1:
+                # Launched from a server, no need for a session token
+                _session = boto3.Session(
+                    region_name=AWSEnv.REGION,
+                    aws_access_key_id=AWSEnv.ACCESS_KEY_ID,
+                    aws_secret_access_key=AWSEnv.SECRET_ACCESS_KEY
+                )
+            else:
+                # Launched from a lambda, a session token is in the env
+                _session = boto3.Session(
+                    # region_name=AWSEnv.REGION,
+                    # aws_access_key_id=AWSEnv.ACCESS_KEY_ID,
+                    # aws_secret_access_key=AWSEnv.SECRET_ACCESS_KEY,
+                    # aws_session_token=AWSEnv.SESSION_TOKEN
+                )
+        return _session
+
+
+def get_client(service_name):
+    """Returns the (shared) boto3 client for a service."""
+    client = _clients.get(service_name)
+    if client is None:
+        with _lock:
+            client = _clients.get(service_name)
+            if client is None:
+                client = get_session().client(service_name)
+                _clients[service_name] = client
+    return client
+
+
+def get_awsauth():
+    from requests_aws4auth import AWS4Auth
+    credentials = get_session().get_credentials()
+    return AWS4Auth(
+        ESEnv.ACCESS_KEY_ID, ESEnv.SECRET_ACCESS_KEY,
+        ESEnv.REGION, "es",
+        session_token=credentials.token
     )
 
-s3 = session.client('s3')
-aws_lambda = session.client('lambda')
-iam = session.client('iam')
-firehose = session.client('firehose')
-ecs = session.client('ecs')
-
-credentials = session.get_credentials()
-awsauth = AWS4Auth(
-    ESEnv.ACCESS_KEY_ID, ESEnv.SECRET_ACCESS_KEY,
-    ESEnv.REGION, "es",
-    session_token=credentials.token
-)
-
-es = Elasticsearch(
-    hosts=[{'host': ESEnv.HOST, 'port': ESEnv.PORT}],
-    http_auth=awsauth,
-    use_ssl=True,
-    verify_certs=True,
-    connection_class=RequestsHttpConnection,
-    request_timeout=120
-)
+
+def get_es():
+    global _es
+    with _lock:
+        if _es is None:
+            from elasticsearch import Elasticsearch, RequestsHttpConnection
+            _es = Elasticsearch(
+                hosts=[{'host': ESEnv.HOST, 'port': ESEnv.PORT}],
+                http_auth=get_awsauth(),
+                use_ssl=True,
+                verify_certs=True,
+                connection_class=RequestsHttpConnection,
+                request_timeout=120
+            )
+        return _es
+
+
+def __getattr__(name):
+    if name == 'session':
+        return get_session()
+    if name in CLIENT_NAMES:
+        return get_client(CLIENT_NAMES[name])
+    if name == 'credentials':
+        return get_session().get_credentials()
+    if name == 'awsauth':
+        return get_awsauth()
+    if name == 'es':
+        return get_es()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
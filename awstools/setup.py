@@ -11,6 +11,15 @@ setuptools.setup(
     install_requires=[
         'python-dotenv', 'aenum', 'dacite',
         'boto3==1.14.48', 'elasticsearch', 'requests_aws4auth'],
+    # Faster JSON encoding/decoding (see awstools.jsoncodec), and the
+    # S3 to Elasticsearch pipeline (see awstools.pipeline)
+    extras_require={
+        'fast': ['orjson'],
+        'pipeline': [
+            'twiprocess @ git+https://github.com/crowdbreaks/twiprocess.git',
+            'local-geocode']},
+    entry_points={'console_scripts': [
+        'backfill-es=awstools.backfill:main']},
     package_data={'awstools': ['awstools.env', 'config/*']},
     classifiers=[
         "Programming Language :: Python :: 3",
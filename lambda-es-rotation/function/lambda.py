@@ -1,7 +1,7 @@
-from awstools.config import config_manager
+from awstools.config import get_config_manager
 from awstools.elasticsearch import create_index
 
 
 def handler(event, context):
-    for conf in config_manager.config:
+    for conf in get_config_manager().config:
         create_index(conf.slug, conf.lang[0])
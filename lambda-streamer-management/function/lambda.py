@@ -2,7 +2,7 @@ import time
 import json
 import logging
 
-from awstools.session import s3, ecs
+from awstools import session
 from awstools.env import ECSEnv, AWSEnv
 from awstools.config import ConfigManager, StorageMode
 from awstools.s3 import get_s3_object
@@ -13,7 +13,7 @@ logger.setLevel(logging.DEBUG)
 
 
 def check_if_currently_active(cluster_name, service_name):
-    response = ecs.describe_services(
+    response = session.get_client('ecs').describe_services(
         cluster=cluster_name,
         services=[service_name]
     )
@@ -43,7 +43,7 @@ def wait_for_desired_count(
     logger.info('%s %s', cluster_name, service_name)
     while not updated:
         # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/ecs.html#ECS.Client.describe_services
-        response = ecs.describe_services(
+        response = session.get_client('ecs').describe_services(
             cluster=cluster_name,
             services=[service_name]
         )
@@ -76,7 +76,7 @@ def start_streamer():
     # To start streaming, set the desired count to 1 and wait
     # until a task is running
     # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/ecs.html#ECS.Client.update_service
-    ecs.update_service(
+    session.get_client('ecs').update_service(
         cluster=ECSEnv.CLUSTER,
         service=ECSEnv.SERVICE,
         desiredCount=1)
@@ -87,7 +87,7 @@ def stop_streamer():
     # To stop the streamer, set the desired count to 0 and wait
     # until tasks are stopped
     # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/ecs.html#ECS.Client.update_service
-    ecs.update_service(
+    session.get_client('ecs').update_service(
         cluster=ECSEnv.CLUSTER,
         service=ECSEnv.SERVICE,
         desiredCount=0)
@@ -98,6 +98,7 @@ def handle_stream_config():
     state = json.loads(get_s3_object(
         ECSEnv.BUCKET_NAME, ECSEnv.STREAM_STATE_S3_KEY))
     state = state['state']
+    s3 = session.get_client('s3')
     response = s3.list_object_versions(
         Prefix=ECSEnv.STREAM_CONFIG_S3_KEY, Bucket=ECSEnv.BUCKET_NAME)
 
@@ -114,10 +115,15 @@ def handle_stream_config():
     # streamer_currently_active = check_if_currently_active(
     #     ECSEnv.CLUSTER, ECSEnv.SERVICE)
 
-    # Restart streaming if configs are different
+    # The streamer reloads a changed config by itself, unless reloading
+    # is disabled: then restart it
     if config_manager_old.write() != config_manager_new.write():
-        if state is True:
-            logger.info('The config changed. Going to restart the streamer.')
+        if state is True and ECSEnv.CONFIG_POLL_INTERVAL:
+            logger.info('The config changed. The streamer will reload it.')
+            start_streamer()
+        elif state is True:
+            logger.info('The config changed, the current state is True. '
+                        'Going to restart the streamer.')
             stop_streamer()
             start_streamer()
         elif state is False:
@@ -10,11 +10,12 @@ setuptools.setup(
     packages=setuptools.find_packages(),
     install_requires=[
         'python-dotenv', 'aenum', 'dacite', 'tweepy',
-        'boto3', 'elasticsearch', 'requests_aws4auth',
+        'boto3', 'elasticsearch', 'requests_aws4auth', 'orjson',
         'twiprocess @ git+https://github.com/crowdbreaks/twiprocess.git',
         'awstools @ git+https://github.com/crowdbreaks/streamer.git#egg=awstools&subdirectory=awstools'],
     entry_points={'console_scripts': [
-        'run-stream=streamer.run:main']},
+        'run-stream=streamer.run:main',
+        'bench-stream=streamer.benchmark:main']},
     package_data={'streamer': ['streamer.env']},
     classifiers=[
         "Programming Language :: Python :: 3",
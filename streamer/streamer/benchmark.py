@@ -0,0 +1,200 @@
+"""
+Offline replay benchmark of the streaming pipeline
+==================================================
+
+Drives a JSONL corpus of tweets through StreamListener/handle_tweet at
+maximum speed, with an in-memory stand-in for Firehose and a synthetic
+config. Reports throughput, per-tweet latency and peak RSS.
+
+    bench-stream tweets.jsonl --n-projects 300 --n-keywords 10
+"""
+
+import argparse
+import logging
+import json
+import random
+import re
+import resource
+import sys
+import threading
+import time
+from collections import Counter
+
+from awstools.config import ConfigManager
+
+from . import tasks
+from .metrics import metrics
+from .stream import StreamListener
+from .work_queue import WorkQueue
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class MemoryFirehose():
+    """Stand-in for the Firehose client, keeps counts only."""
+    def __init__(self):
+        self.records = Counter()
+        self.bytes = 0
+
+    def put_record_batch(self, DeliveryStreamName, Records):
+        self.records[DeliveryStreamName] += len(Records)
+        self.bytes += sum(len(record['Data']) for record in Records)
+        return {
+            'FailedPutCount': 0,
+            'RequestResponses': [{'RecordId': ''} for _ in Records]}
+
+
+def synthetic_config(corpus, n_projects, n_keywords, multi_word, seed=0):
+    """Builds a config with keywords drawn from the corpus vocabulary."""
+    rand = random.Random(seed)
+    words = Counter()
+    for raw_data in corpus[:10000]:
+        text = json.loads(raw_data).get('text', '')
+        words.update(re.findall(r'[a-z]{4,}', text.lower()))
+    vocabulary = [word for word, _ in words.most_common(5000)] or ['tweet']
+    raw = []
+    for i in range(n_projects):
+        keywords = []
+        for _ in range(n_keywords):
+            if rand.random() < multi_word:
+                keywords.append(' '.join(rand.sample(vocabulary, 2)))
+            else:
+                keywords.append(rand.choice(vocabulary))
+        raw.append({
+            'keywords': keywords,
+            'lang': ['en'],
+            'locales': ['en'],
+            'slug': f'project{i:04d}',
+            'es_index_name': f'project{i:04d}',
+            'storage_mode': 's3',
+            'image_storage_mode': 'inactive',
+            'model_endpoints': {}})
+    return ConfigManager(raw=raw)
+
+
+def peak_rss_mb():
+    usage = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # Kilobytes on Linux, bytes on macOS
+    return usage / 1024 if sys.platform != 'darwin' else usage / 1024 ** 2
+
+
+def join_workers(listener, errors, poll_interval=1.):
+    """Waits until the queue is processed, raises if a worker thread
+    died, as its status would never be marked as done.
+    """
+    while not listener.q.join(timeout=poll_interval):
+        if errors:
+            raise RuntimeError('Worker thread failed') from errors[0]
+        if not all(thread.is_alive() for thread in listener.threads):
+            raise RuntimeError('Worker thread died')
+
+
+def run_benchmark(corpus, config_manager, num_workers, mode, repeat=1):
+    firehose = MemoryFirehose()
+    sender = tasks.get_sender()
+    sender.client = firehose
+    listener = StreamListener(
+        q=WorkQueue(), config_manager=config_manager,
+        num_workers=num_workers, mode=mode)
+    if listener.pool is not None:
+        # Start the worker processes before measuring
+        listener.pool.process(corpus[:1], config_manager)
+    metrics.compute(num_workers)
+
+    # Exceptions that end worker threads, raised in the benchmark
+    errors = []
+    excepthook = threading.excepthook
+
+    def on_thread_exception(args):
+        errors.append(args.exc_value)
+        excepthook(args)
+
+    threading.excepthook = on_thread_exception
+    start = time.perf_counter()
+    try:
+        for _ in range(repeat):
+            for raw_data in corpus:
+                listener.on_data(raw_data)
+        join_workers(listener, errors)
+    finally:
+        threading.excepthook = excepthook
+    sender.flush()
+    elapsed = time.perf_counter() - start
+
+    snapshot = metrics.compute(num_workers)
+    handle = snapshot['stages'].get('handle', {})
+    n_tweets = len(corpus) * repeat
+    return {
+        'tweets': n_tweets,
+        'seconds': elapsed,
+        'tweets_per_second': n_tweets / elapsed,
+        'latency_p50_ms': handle.get('p50', 0.) * 1000,
+        'latency_p99_ms': handle.get('p99', 0.) * 1000,
+        'records_sent': sum(firehose.records.values()),
+        'bytes_sent': firehose.bytes,
+        'peak_rss_mb': peak_rss_mb(),
+        'stages_ms': {
+            stage: {
+                stat: stats[stat] * 1000 for stat in ['p50', 'p99', 'max']}
+            for stage, stats in snapshot['stages'].items()}}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Replays a JSONL corpus of tweets through the streamer.')
+    parser.add_argument('corpus', help='JSONL file, one tweet per line')
+    parser.add_argument(
+        '--n-projects', type=int, default=100,
+        help='number of projects in the synthetic config')
+    parser.add_argument(
+        '--n-keywords', type=int, default=10,
+        help='number of keywords per project')
+    parser.add_argument(
+        '--multi-word', type=float, default=0.2,
+        help='fraction of multi-word keywords')
+    parser.add_argument(
+        '--workers', type=int, default=4, help='number of workers')
+    parser.add_argument(
+        '--mode', choices=['thread', 'process'], default='thread',
+        help='worker mode')
+    parser.add_argument(
+        '--repeat', type=int, default=1,
+        help='number of times the corpus is replayed')
+    parser.add_argument(
+        '--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    with open(args.corpus, 'r', encoding='utf-8') as f:
+        corpus = [line.strip() for line in f if line.strip()]
+    config_manager = synthetic_config(
+        corpus, args.n_projects, args.n_keywords, args.multi_word)
+
+    report = run_benchmark(
+        corpus, config_manager, args.workers, args.mode, args.repeat)
+    report.update({
+        'projects': args.n_projects,
+        'keywords_per_project': args.n_keywords,
+        'workers': args.workers,
+        'mode': args.mode})
+
+    if args.json:
+        print(json.dumps(report, indent=4))
+        return
+    print(
+        f"{report['tweets']} tweets in {report['seconds']:.2f} s: "
+        f"{report['tweets_per_second']:.0f} tweets/s "
+        f"({args.mode} mode, {args.workers} workers, "
+        f"{args.n_projects} projects x {args.n_keywords} keywords)")
+    print(
+        f"Per-tweet latency p50 {report['latency_p50_ms']:.3f} ms, "
+        f"p99 {report['latency_p99_ms']:.3f} ms")
+    print(f"Peak RSS {report['peak_rss_mb']:.1f} MB")
+    print(f"Records sent {report['records_sent']}")
+    for stage, stats in sorted(report['stages_ms'].items()):
+        print(
+            f"  {stage:<14} p50 {stats['p50']:8.3f} ms  "
+            f"p99 {stats['p99']:8.3f} ms  max {stats['max']:8.3f} ms")
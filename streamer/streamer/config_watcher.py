@@ -0,0 +1,66 @@
+"""
+Watches the stream config on S3 and swaps in new versions while the
+stream keeps running.
+"""
+
+import logging
+import threading
+
+from awstools.env import AWSEnv
+from awstools.config import ConfigManager
+from awstools.s3 import get_s3_object_etag
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+
+class ConfigWatcher():
+    """Polls the ETag of the stream config, reloads it when it changed.
+
+    `on_change(old, new)` is called with both config managers before
+    the new one becomes `config_manager`.
+    """
+    def __init__(self, config_manager, interval=60, on_change=None):
+        self.config_manager = config_manager
+        self.interval = interval
+        self.on_change = on_change
+        self._etag = None
+        self._stopped = threading.Event()
+
+    def poll(self):
+        """Returns True if a new config has been swapped in."""
+        etag = get_s3_object_etag(
+            AWSEnv.BUCKET_NAME, AWSEnv.STREAM_CONFIG_S3_KEY)
+        if etag == self._etag:
+            return False
+        old = self.config_manager
+        new = ConfigManager()
+        if new.write() == old.write():
+            self._etag = etag
+            return False
+        logger.info('The stream config changed. Reloading.')
+        if self.on_change is not None:
+            self.on_change(old, new)
+        self.config_manager = new
+        # Only now, so that a failed reload is retried on the next poll
+        self._etag = etag
+        return True
+
+    def start(self):
+        if not self.interval:
+            return
+        thread = threading.Thread(target=self._poll_periodically)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _poll_periodically(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as exc:
+                logger.error(
+                    'Config reloading exception %s: %s',
+                    type(exc).__name__, str(exc))
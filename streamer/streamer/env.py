@@ -14,3 +14,64 @@ class TwiEnv(Constant):
     CONSUMER_SECRET = os.environ.get('TWI_CONSUMER_SECRET')
     OAUTH_TOKEN = os.environ.get('TWI_OAUTH_TOKEN')
     OAUTH_TOKEN_SECRET = os.environ.get('TWI_OAUTH_TOKEN_SECRET')
+
+
+class QueueEnv(Constant):
+    """Work queue between the stream reader and the workers."""
+    # Capacity, 0 means unlimited
+    MAX_ITEMS = int(os.environ.get('QUEUE_MAX_ITEMS', '20000'))
+    MAX_BYTES = int(os.environ.get('QUEUE_MAX_BYTES', str(256 * 1024 ** 2)))
+    # What to do when full: block, drop_oldest or spill (to local disk)
+    OVERFLOW_POLICY = os.environ.get('QUEUE_OVERFLOW_POLICY', 'block')
+
+
+class WorkerEnv(Constant):
+    """Tweet handling workers (their number is Env.NUM_WORKERS)."""
+    # thread, or process to use a pool of worker processes
+    MODE = os.environ.get('WORKER_MODE', 'thread').lower()
+    # Number of statuses sent to a worker process at once
+    PROCESS_BATCH_SIZE = int(os.environ.get(
+        'WORKER_PROCESS_BATCH_SIZE', '50'))
+
+
+class SpillEnv(Constant):
+    """Local log of records that could not be sent to Firehose."""
+    MAX_SEGMENT_BYTES = int(os.environ.get(
+        'SPILL_MAX_SEGMENT_BYTES', str(64 * 1024 ** 2)))
+    # Seconds between replays of the log
+    REPLAY_INTERVAL = int(os.environ.get('SPILL_REPLAY_INTERVAL', '60'))
+    # Records per second sent when replaying
+    REPLAY_RATE = int(os.environ.get('SPILL_REPLAY_RATE', '1000'))
+
+
+class MetricsEnv(Constant):
+    """Latency and throughput metrics."""
+    # emf (CloudWatch Embedded Metric Format), prometheus, log or none
+    FORMAT = os.environ.get('METRICS_FORMAT', 'emf').lower()
+    INTERVAL = int(os.environ.get('METRICS_INTERVAL', '60'))
+    PORT = int(os.environ.get('METRICS_PORT', '9100'))
+    NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'Crowdbreaks/Streamer')
+
+
+class ConfigEnv(Constant):
+    """Reloading of the stream config."""
+    # Seconds between checks of the config on S3, 0 disables reloading
+    POLL_INTERVAL = int(os.environ.get('CONFIG_POLL_INTERVAL', '60'))
+
+
+class ProvisionEnv(Constant):
+    """Creation of delivery streams and indices at startup."""
+    # Resources created concurrently
+    MAX_WORKERS = int(os.environ.get('PROVISION_MAX_WORKERS', '8'))
+    # Record of the provisioned resources, to skip provisioning on restart
+    MANIFEST_S3_KEY = os.environ.get(
+        'PROVISION_MANIFEST_S3_KEY', 'configs/stream/provisioning.json')
+
+
+class LocalStoreEnv(Constant):
+    """Unmatched and match test statuses stored on local disk."""
+    MAX_SEGMENT_BYTES = int(os.environ.get(
+        'LOCAL_STORE_MAX_SEGMENT_BYTES', str(64 * 1024 ** 2)))
+    # Seconds after which a segment is closed
+    MAX_SEGMENT_AGE = int(os.environ.get(
+        'LOCAL_STORE_MAX_SEGMENT_AGE', '3600'))
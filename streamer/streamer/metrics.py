@@ -0,0 +1,263 @@
+"""
+Per-stage latency and throughput metrics of the streamer.
+
+Timings, counters and worker busy time are aggregated over an interval
+and emitted either as CloudWatch Embedded Metric Format (EMF) lines on
+stdout, as a Prometheus text endpoint, or as plain log lines.
+"""
+
+import logging
+import sys
+import json
+import time
+import random
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+
+class Metrics():
+    """Registry of timings (per stage), counters and gauges."""
+    # Timing samples kept per stage and interval (reservoir sampling)
+    MAX_SAMPLES = 10000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._gauges = {}
+        self._reset()
+        self.snapshot = {}
+
+    def timing(self, stage, seconds):
+        with self._lock:
+            timing = self._timings[stage]
+            timing['count'] += 1
+            timing['sum'] += seconds
+            timing['max'] = max(timing['max'], seconds)
+            samples = timing['samples']
+            if len(samples) < self.MAX_SAMPLES:
+                samples.append(seconds)
+            else:
+                i = random.randrange(timing['count'])
+                if i < self.MAX_SAMPLES:
+                    samples[i] = seconds
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timing(stage, time.perf_counter() - start)
+
+    def count(self, name, value=1):
+        with self._lock:
+            self._counters[name] += value
+
+    def busy(self, seconds):
+        """Adds time a worker spent handling statuses."""
+        with self._lock:
+            self._busy += seconds
+
+    def gauge(self, name, func):
+        """Registers a function returning the current value of a gauge."""
+        self._gauges[name] = func
+
+    def collect(self):
+        """Returns and resets the raw data (e.g. of a worker process)."""
+        with self._lock:
+            raw = {
+                'timings': dict(self._timings),
+                'counters': dict(self._counters),
+                'busy': self._busy}
+            self._reset(keep_start=True)
+        return raw
+
+    def merge(self, raw):
+        """Adds raw data collected by another registry."""
+        with self._lock:
+            for stage, other in raw['timings'].items():
+                timing = self._timings[stage]
+                timing['count'] += other['count']
+                timing['sum'] += other['sum']
+                timing['max'] = max(timing['max'], other['max'])
+                free = self.MAX_SAMPLES - len(timing['samples'])
+                timing['samples'].extend(other['samples'][:free])
+            for name, value in raw['counters'].items():
+                self._counters[name] += value
+            self._busy += raw['busy']
+
+    def compute(self, num_workers):
+        """Aggregates the current interval into a snapshot and resets."""
+        with self._lock:
+            timings, counters, busy = \
+                self._timings, self._counters, self._busy
+            elapsed = max(time.time() - self._start, 1e-9)
+            self._reset()
+        snapshot = {'stages': {}, 'rates': {}, 'gauges': {}}
+        for stage, timing in timings.items():
+            samples = sorted(timing['samples'])
+            snapshot['stages'][stage] = {
+                'count': timing['count'],
+                'mean': timing['sum'] / timing['count'],
+                'p50': _percentile(samples, 0.5),
+                'p99': _percentile(samples, 0.99),
+                'max': timing['max']}
+        for name, value in counters.items():
+            snapshot['rates'][name] = value / elapsed
+        snapshot['gauges'] = {
+            name: func() for name, func in self._gauges.items()}
+        snapshot['gauges']['worker_utilization'] = \
+            busy / (elapsed * num_workers)
+        self.snapshot = snapshot
+        return snapshot
+
+    def _reset(self, keep_start=False):
+        self._timings = defaultdict(
+            lambda: {'count': 0, 'sum': 0., 'max': 0., 'samples': []})
+        self._counters = defaultdict(int)
+        self._busy = 0.
+        if not keep_start:
+            self._start = time.time()
+
+
+def _percentile(samples, q):
+    if not samples:
+        return 0.
+    return samples[min(int(q * len(samples)), len(samples) - 1)]
+
+
+def to_emf(snapshot, namespace, timestamp=None):
+    """Formats a snapshot as CloudWatch Embedded Metric Format lines."""
+    timestamp = int((timestamp or time.time()) * 1000)
+    lines = []
+    values = {}
+    units = {}
+    for stage, stats in snapshot['stages'].items():
+        for stat in ['mean', 'p50', 'p99', 'max']:
+            values[f'{stage}_{stat}'] = stats[stat] * 1000
+            units[f'{stage}_{stat}'] = 'Milliseconds'
+    for name, value in snapshot['gauges'].items():
+        values[name] = value
+        units[name] = 'None'
+    if 'tweets' in snapshot['rates']:
+        values['tweets_per_second'] = snapshot['rates']['tweets']
+        units['tweets_per_second'] = 'Count/Second'
+    lines.append(_emf_line(namespace, timestamp, [], values, units))
+    for name, rate in snapshot['rates'].items():
+        if name.startswith('tweets.'):
+            lines.append(_emf_line(
+                namespace, timestamp, ['project'],
+                {'tweets_per_second': rate},
+                {'tweets_per_second': 'Count/Second'},
+                project=name[len('tweets.'):]))
+    return lines
+
+
+def _emf_line(namespace, timestamp, dimensions, values, units, **properties):
+    return json.dumps({
+        '_aws': {
+            'Timestamp': timestamp,
+            'CloudWatchMetrics': [{
+                'Namespace': namespace,
+                'Dimensions': [dimensions],
+                'Metrics': [
+                    {'Name': name, 'Unit': units[name]} for name in values]
+            }]
+        },
+        **properties,
+        **values})
+
+
+def to_prometheus(snapshot):
+    """Formats a snapshot in the Prometheus text exposition format."""
+    lines = []
+    for stage, stats in snapshot.get('stages', {}).items():
+        for stat, quantile in [('p50', '0.5'), ('p99', '0.99')]:
+            lines.append(
+                'streamer_stage_seconds{stage="%s",quantile="%s"} %f' % (
+                    stage, quantile, stats[stat]))
+        lines.append('streamer_stage_seconds_max{stage="%s"} %f' % (
+            stage, stats['max']))
+        lines.append('streamer_stage_count{stage="%s"} %d' % (
+            stage, stats['count']))
+    for name, rate in snapshot.get('rates', {}).items():
+        if name.startswith('tweets.'):
+            lines.append('streamer_tweets_per_second{project="%s"} %f' % (
+                name[len('tweets.'):], rate))
+        else:
+            lines.append(
+                'streamer_%s_per_second %f' % (name.replace('.', '_'), rate))
+    for name, value in snapshot.get('gauges', {}).items():
+        lines.append('streamer_%s %f' % (name, value))
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsEmitter():
+    """Periodically computes and emits the metrics of a registry."""
+    def __init__(
+        self, registry, num_workers, fmt='emf', interval=60,
+        port=9100, namespace='Crowdbreaks/Streamer'
+    ):
+        self.registry = registry
+        self.num_workers = num_workers
+        self.fmt = fmt
+        self.interval = interval
+        self.port = port
+        self.namespace = namespace
+
+    def start(self):
+        if self.fmt == 'none':
+            return
+        if self.fmt == 'prometheus':
+            self._serve()
+        thread = threading.Thread(target=self._emit_periodically)
+        thread.daemon = True
+        thread.start()
+
+    def emit(self):
+        snapshot = self.registry.compute(self.num_workers)
+        if self.fmt == 'emf':
+            for line in to_emf(snapshot, self.namespace):
+                sys.stdout.write(line + '\n')
+            sys.stdout.flush()
+        elif self.fmt == 'log':
+            logger.info('Metrics: %s', json.dumps(snapshot))
+
+    def _emit_periodically(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.emit()
+            except Exception as exc:
+                logger.error(
+                    'Metrics exception %s: %s', type(exc).__name__, str(exc))
+
+    def _serve(self):
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = to_prometheus(registry.snapshot).encode()
+                self.send_response(200)
+                self.send_header(
+                    'Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(('', self.port), Handler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        logger.info('Serving metrics on port %d.', self.port)
+
+
+# Shared by all modules of a process
+metrics = Metrics()
@@ -0,0 +1,93 @@
+"""
+Handles statuses in worker processes, to use all available CPUs.
+Raw statuses go in, records ready to be sent to Firehose come back.
+"""
+
+import logging
+import time
+import multiprocessing
+from threading import Lock, Thread
+
+from awstools import jsoncodec
+from awstools.config import ConfigManager
+
+from .metrics import metrics
+from .setup_logging import setup_logging
+from .tasks import process_tweet
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+# Config of the worker process
+_config_manager = None
+
+
+def _init_worker(raw_config):
+    global _config_manager
+    # Spawned processes start without the logging of the main process
+    setup_logging()
+    _config_manager = ConfigManager(raw=raw_config)
+
+
+def _process_batch(raw_statuses):
+    start = time.perf_counter()
+    records = []
+    for raw_data in raw_statuses:
+        status_start = time.perf_counter()
+        try:
+            records.extend(
+                process_tweet(jsoncodec.loads(raw_data), _config_manager))
+        except KeyError as exc:
+            logger.error(
+                '%s: %s\n%s', type(exc).__name__, str(exc), raw_data)
+        metrics.timing('handle', time.perf_counter() - status_start)
+    metrics.busy(time.perf_counter() - start)
+    # Metrics of the worker process are merged into the main process
+    return records, metrics.collect()
+
+
+class ProcessTweetPool():
+    """Pool of worker processes running process_tweet.
+
+    Worker processes get the config at start, so the pool is
+    replaced by a new one whenever the config manager changes.
+    """
+    def __init__(self, num_workers):
+        self.num_workers = num_workers
+        self._context = multiprocessing.get_context('spawn')
+        self._lock = Lock()
+        self._pool = None
+        self._config_manager = None
+
+    def process(self, raw_statuses, config_manager):
+        """Returns the records (destination, data) for raw statuses,
+        and the raw metrics of the worker process.
+        """
+        return self._get_pool(config_manager).apply(
+            _process_batch, (raw_statuses,))
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.close()
+                self._pool.join()
+                self._pool = None
+
+    def _get_pool(self, config_manager):
+        with self._lock:
+            if self._pool is None or \
+                    config_manager is not self._config_manager:
+                old_pool = self._pool
+                self._pool = self._context.Pool(
+                    self.num_workers, initializer=_init_worker,
+                    initargs=(config_manager.dict,))
+                self._config_manager = config_manager
+                logger.info(
+                    'Started %d worker processes.', self.num_workers)
+                if old_pool is not None:
+                    # Let the old workers finish what they have
+                    old_pool.close()
+                    thread = Thread(target=old_pool.join)
+                    thread.daemon = True
+                    thread.start()
+            return self._pool
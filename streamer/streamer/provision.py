@@ -0,0 +1,205 @@
+"""
+Creates the delivery streams and ES indices of projects concurrently.
+
+What has been created is recorded in a manifest, stored locally and
+on S3, so that restarts only verify the resources with cheap describe
+calls instead of provisioning them again.
+"""
+
+import logging
+import os
+import io
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+from awstools import jsoncodec
+from awstools import session
+from awstools.env import KFEnv, ESEnv
+from awstools.firehose import (create_delivery_stream,
+                               get_delivery_stream_status)
+from awstools.elasticsearch import create_index, index_exists
+from awstools.s3 import get_s3_object
+
+from .env import ProvisionEnv
+from .setup_logging import LogDirs
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+MANIFEST_PATH = os.path.join(LogDirs.LOGS.value, 'provisioning.json')
+
+# Resource names depend on these settings as well
+SETTINGS = [
+    (KFEnv, [
+        'APP_NAME', 'REGION', 'ACCOUNT_NUM', 'BUCKET_NAME',
+        'STORAGE_BUCKET_PREFIX', 'BUFFER_SIZE', 'BUFFER_INTERVAL',
+        'UNMATCHED_STREAM_NAME']),
+    (ESEnv, ['HOST', 'PORT', 'INDEX_PREFIX', 'CONFIG_S3_KEY']),
+]
+
+
+def provision(confs, unmatched=False, max_workers=ProvisionEnv.MAX_WORKERS):
+    """Creates delivery streams and ES indices for projects.
+
+    With `unmatched`, also creates the delivery stream of unmatched
+    tweets. Resources are created by a bounded pool of threads, the
+    first error is raised once all of them are done.
+
+    Returns the created resources by slug, e.g.
+    `{slug: {'stream': stream_name, 'index': index_name}}`.
+    """
+    tasks = []
+    if unmatched:
+        tasks.append((
+            KFEnv.UNMATCHED_STREAM_NAME, 'stream', create_delivery_stream,
+            (KFEnv.UNMATCHED_STREAM_NAME,
+             f'{KFEnv.UNMATCHED_STREAM_NAME}/')))
+    for conf in confs:
+        tasks.append((
+            conf.slug, 'stream', create_delivery_stream,
+            (conf.slug, f'{KFEnv.STORAGE_BUCKET_PREFIX}{conf.slug}/')))
+        tasks.append((
+            conf.slug, 'index', create_index,
+            (conf.slug, conf.lang[0], True)))
+    if not tasks:
+        return {}
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            (slug, kind, executor.submit(_timed, func, *args))
+            for slug, kind, func, args in tasks]
+    resources = {}
+    timings = {}
+    errors = []
+    for slug, kind, future in futures:
+        try:
+            result, timings[f'{kind} {slug}'] = future.result()
+            resources.setdefault(slug, {})[kind] = result
+        except Exception as exc:
+            logger.error(
+                'Provisioning of %s %s failed %s: %s',
+                kind, slug, type(exc).__name__, str(exc))
+            errors.append(exc)
+
+    logger.info(
+        'Provisioned %d resource(s) in %.1f s.',
+        len(timings), time.perf_counter() - start)
+    for name, seconds in sorted(
+            timings.items(), key=lambda item: item[1], reverse=True):
+        logger.info('  %-40s %6.1f s', name, seconds)
+    if errors:
+        raise errors[0]
+    return resources
+
+
+def ensure_provisioned(
+    config_manager, unmatched=True, max_workers=ProvisionEnv.MAX_WORKERS
+):
+    """Provisions what the manifest does not show as existing.
+
+    Projects recorded in the manifest are verified (the delivery stream
+    is active and the index exists) and only the missing ones are
+    provisioned. The manifest is then updated.
+    """
+    start = time.perf_counter()
+    key = manifest_key(config_manager)
+    settings_key = manifest_key()
+    manifest = load_manifest()
+    if manifest is None or manifest.get('settings_key') != settings_key:
+        manifest = {'resources': {}}
+    resources = verify(manifest['resources'], max_workers)
+
+    slugs = {conf.slug for conf in config_manager.config}
+    if unmatched:
+        slugs.add(KFEnv.UNMATCHED_STREAM_NAME)
+    missing = [
+        conf for conf in config_manager.config
+        if conf.slug not in resources]
+    missing_unmatched = \
+        unmatched and KFEnv.UNMATCHED_STREAM_NAME not in resources
+    if not missing and not missing_unmatched:
+        logger.info(
+            'Provisioning manifest verified in %.1f s, nothing to do.',
+            time.perf_counter() - start)
+        if manifest.get('key') == key:
+            return resources
+    else:
+        resources.update(provision(
+            missing, unmatched=missing_unmatched, max_workers=max_workers))
+
+    save_manifest({
+        'key': key,
+        'settings_key': settings_key,
+        'resources': {
+            slug: resource for slug, resource in resources.items()
+            if slug in slugs}})
+    return resources
+
+
+def verify(resources, max_workers=ProvisionEnv.MAX_WORKERS):
+    """Returns the recorded resources that still exist."""
+    def exists(resource):
+        if get_delivery_stream_status(resource['stream']) != 'ACTIVE':
+            return False
+        return 'index' not in resource or index_exists(resource['index'])
+
+    if not resources:
+        return {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = dict(zip(
+            resources, executor.map(exists, resources.values())))
+    for slug, ok in results.items():
+        if not ok:
+            logger.warning('Resources of %s are missing.', slug)
+    return {slug: resources[slug] for slug, ok in results.items() if ok}
+
+
+def manifest_key(config_manager=None):
+    """Hashes the settings (and the config) resources depend on."""
+    settings = {
+        f'{env.__name__}.{name}': str(getattr(env, name))
+        for env, names in SETTINGS for name in names}
+    if config_manager is not None:
+        settings['config'] = config_manager.write()
+    return hashlib.sha256(jsoncodec.dumps(settings)).hexdigest()
+
+
+def load_manifest():
+    """Loads the manifest from disk, or from S3 after a fresh start."""
+    try:
+        with open(MANIFEST_PATH, 'rb') as f:
+            return jsoncodec.loads(f.read())
+    except (OSError, ValueError):
+        pass
+    try:
+        return jsoncodec.loads(get_s3_object(
+            KFEnv.BUCKET_NAME, ProvisionEnv.MANIFEST_S3_KEY))
+    except Exception as exc:
+        logger.info(
+            'No provisioning manifest %s: %s', type(exc).__name__, str(exc))
+        return None
+
+
+def save_manifest(manifest):
+    data = jsoncodec.dumps(manifest)
+    os.makedirs(os.path.dirname(MANIFEST_PATH), exist_ok=True)
+    tmp_path = MANIFEST_PATH + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, MANIFEST_PATH)
+    try:
+        session.s3.upload_fileobj(
+            io.BytesIO(data), KFEnv.BUCKET_NAME,
+            ProvisionEnv.MANIFEST_S3_KEY)
+    except Exception as exc:
+        logger.warning(
+            'Could not upload the provisioning manifest %s: %s',
+            type(exc).__name__, str(exc))
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
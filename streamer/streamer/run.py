@@ -2,16 +2,20 @@ import logging
 import sys
 import os
 import time
+import signal
+import threading
 
 from tweepy import OAuthHandler
 
-from awstools.env import KFEnv
-from awstools.config import config_manager
-from awstools.firehose import create_delivery_stream
-from awstools.elasticsearch import create_index
+from awstools.env import Env
+from awstools.config import get_config_manager
 
-from .env import TwiEnv
+from .env import TwiEnv, MetricsEnv, ConfigEnv
+from .config_watcher import ConfigWatcher
+from .metrics import metrics, MetricsEmitter
+from .provision import ensure_provisioned
 from .stream import StreamListener, StreamManager
+from .tasks import get_sender, get_spill_log, close_local_stores
 from .setup_logging import setup_logging
 
 logger = logging.getLogger(__name__)
@@ -25,6 +29,23 @@ def run():
     # Setting things up
     auth = get_auth()
     listener = StreamListener()
+    stream = None
+    reconnect = threading.Event()
+
+    def on_config_change(old, new):
+        # New projects need their delivery streams and indices first
+        ensure_provisioned(new)
+        listener.config_manager = new
+        # Reconnect only if the pooled filter changed
+        if new.filter_config != old.filter_config:
+            logger.info('Keywords or languages changed. Reconnecting.')
+            reconnect.set()
+            if stream is not None:
+                stream.stop()
+
+    ConfigWatcher(
+        listener.config_manager, interval=ConfigEnv.POLL_INTERVAL,
+        on_change=on_config_change).start()
     # Wait for a bit before connecting, in case container will be paused
     logger.debug('Streaming container is ready, waiting 10 s.')
     time.sleep(10)
@@ -50,6 +71,9 @@ def run():
             n_errors_last_hour = update_error_count(
                 n_errors_last_hour, last_error_time)
             last_error_time = time.time()
+        if reconnect.is_set():
+            reconnect.clear()
+            continue
         wait_some_time(n_errors_last_hour)
     logger.info('Shutting down...')
 
@@ -69,6 +93,11 @@ def wait_some_time(n_errors_last_hour):
         time.sleep(min(base_delay * n_errors_last_hour, 1800))
 
 
+def handle_sigterm(signum, frame):
+    # ECS stops the container with SIGTERM, exit cleanly to flush buffers
+    sys.exit()
+
+
 def get_auth():
     if TwiEnv.CONSUMER_KEY is None or TwiEnv.CONSUMER_SECRET is None or \
             TwiEnv.OAUTH_TOKEN is None or TwiEnv.OAUTH_TOKEN_SECRET is None:
@@ -83,13 +112,24 @@ def main():
     logger.info(os.path.dirname(os.path.realpath(__file__)))
     logger.info(os.getcwd())
 
-    # Create a delivery stream for unmanched tweets
-    create_delivery_stream(
-        KFEnv.UNMATCHED_STREAM_NAME,
-        f'{KFEnv.UNMATCHED_STREAM_NAME}/')
-    # Create delivery streams and ES indices for the lsited projects
-    for conf in config_manager.config:
-        create_delivery_stream(
-            conf.slug, f'{KFEnv.STORAGE_BUCKET_PREFIX}{conf.slug}/')
-        create_index(conf.slug, conf.lang[0], only_new=True)
-    run()
+    # Create delivery streams and ES indices for the listed projects and
+    # a delivery stream for unmatched tweets, unless the manifest shows
+    # they already exist
+    ensure_provisioned(get_config_manager())
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    # Created here, not at import: spawned workers import this module
+    sender = get_sender()
+    spill_log = get_spill_log()
+    # Also sends what is left over from previous runs
+    spill_log.start_replayer(sender)
+    MetricsEmitter(
+        metrics, int(Env.NUM_WORKERS),
+        fmt=MetricsEnv.FORMAT, interval=MetricsEnv.INTERVAL,
+        port=MetricsEnv.PORT, namespace=MetricsEnv.NAMESPACE).start()
+    try:
+        run()
+    finally:
+        logger.info('Flushing pending records.')
+        sender.close()
+        spill_log.close()
+        close_local_stores()
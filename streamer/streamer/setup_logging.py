@@ -21,6 +21,8 @@ class LogDirs(Enum):
     UNMATCHED = os.path.join(TWEETS, 'unmatched')
     MATCH_TEST = os.path.join(TWEETS, 'match_test')
     KEY_ERRORS = os.path.join(TWEETS, 'key_errors')
+    QUEUE_SPILL = os.path.join(TWEETS, 'queue_spill')
+    FIREHOSE_SPILL = os.path.join(TWEETS, 'firehose_spill')
 
     @classmethod
     def create_folders(cls):
@@ -0,0 +1,102 @@
+"""
+Local write-ahead log for records that could not be sent to Firehose.
+Records are replayed to their delivery streams in the background.
+"""
+
+import logging
+import os
+import time
+import threading
+from collections import defaultdict
+
+from .utils.segment_writer import SegmentWriter, read_segment
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+
+class SpillLog():
+    """Append-only, compressed log of failed records.
+
+    Each line is the delivery stream name and the record, tab separated.
+    """
+    # Records sent to Firehose at once during a replay
+    REPLAY_BATCH_SIZE = 500
+
+    def __init__(
+        self, directory, max_segment_bytes=64 * 1024 ** 2,
+        replay_interval=60, replay_rate=1000
+    ):
+        self.writer = SegmentWriter(
+            directory, 'firehose', max_bytes=max_segment_bytes)
+        self.replay_interval = replay_interval
+        self.replay_rate = replay_rate
+        self._stopped = threading.Event()
+        self._replayer = None
+
+    def write(self, stream_name, records):
+        """Appends records (bytes, newline terminated) for stream_name."""
+        prefix = stream_name.encode() + b'\t'
+        self.writer.write(b''.join(prefix + data for data in records))
+        self.writer.flush(sync=True)
+        logger.warning(
+            'Spilled %d record(s) for stream %s to disk.',
+            len(records), stream_name)
+
+    def replay(self, sender):
+        """Sends the logged records to their delivery streams.
+
+        Records failing again go back to the log (through the sender's
+        on_failure). Stops after the first segment with failures.
+        Returns the number of failed records.
+        """
+        self.writer.rotate()
+        failed = 0
+        for path in self.writer.segments():
+            if self._stopped.is_set() or failed:
+                break
+            records = defaultdict(list)
+            for line in read_segment(path):
+                stream_name, data = line.split(b'\t', 1)
+                records[stream_name.decode()].append(data)
+            n_records = 0
+            for stream_name, stream_records in records.items():
+                for i in range(
+                        0, len(stream_records), self.REPLAY_BATCH_SIZE):
+                    batch = stream_records[i:i + self.REPLAY_BATCH_SIZE]
+                    failed += len(sender.send(stream_name, batch))
+                    n_records += len(batch)
+                    # Rate limiting
+                    time.sleep(len(batch) / self.replay_rate)
+            os.remove(path)
+            logger.info(
+                'Replayed %d record(s) from %s, %d failed.',
+                n_records, os.path.basename(path), failed)
+        return failed
+
+    def start_replayer(self, sender):
+        """Replays the log right away, then every replay_interval s."""
+        self._replayer = threading.Thread(
+            target=self._replay_periodically, args=(sender,))
+        self._replayer.daemon = True
+        self._replayer.start()
+
+    def close(self):
+        self._stopped.set()
+        self.writer.close()
+
+    def _replay_periodically(self, sender):
+        delay = self.replay_interval
+        while not self._stopped.is_set():
+            try:
+                failed = self.replay(sender)
+            except Exception as exc:
+                logger.error(
+                    'Replay exception %s: %s', type(exc).__name__, str(exc))
+                failed = True
+            # Back off while Firehose keeps failing
+            if failed:
+                delay = min(delay * 2, self.replay_interval * 16)
+            else:
+                delay = self.replay_interval
+            self._stopped.wait(delay)
@@ -1,17 +1,21 @@
 import logging
 import time
-import json
 
-from queue import Queue
 from threading import Thread
 
 import tweepy
 
-from awstools.config import config_manager
+from awstools import jsoncodec
+from awstools.config import get_config_manager
 from awstools.env import Env
 
+from .env import QueueEnv, WorkerEnv
+from .setup_logging import LogDirs
 from .utils.errors import ERROR_CODES
-from .tasks import handle_tweet
+from .metrics import metrics
+from .tasks import handle_tweet, dispatch
+from .pool import ProcessTweetPool
+from .work_queue import WorkQueue, OverflowPolicy
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
@@ -20,12 +24,13 @@ logger.setLevel(logging.DEBUG)
 class StreamManager():
     def __init__(self, auth, listener):
         # High chunk_size means lower latency but higher processing efficiency
+        self.listener = listener
         self.stream = tweepy.Stream(
             auth=auth, listener=listener, tweet_mode='extended',
             parser=tweepy.parsers.JSONParser())
 
     def start(self):
-        config = config_manager.filter_config
+        config = self.listener.config_manager.filter_config
         logger.info(
             'Starting to track for keywords %s in languages %s.',
             config.keywords, config.lang)
@@ -40,33 +45,80 @@ class StreamManager():
 
 class StreamListener(tweepy.StreamListener):
     """Handles data received from the stream."""
-    def __init__(self, q=Queue()):
+    def __init__(
+        self, q=None, config_manager=None,
+        num_workers=Env.NUM_WORKERS, mode=WorkerEnv.MODE
+    ):
         # Threads and queues are to avoid IncompleteRead error:
         # https://stackoverflow.com/a/48046123/4949133
         super().__init__()
         self.rate_error_count = 0
+        self.config_manager = config_manager or get_config_manager()
+        if q is None:
+            q = WorkQueue(
+                max_items=QueueEnv.MAX_ITEMS,
+                max_bytes=QueueEnv.MAX_BYTES,
+                policy=OverflowPolicy.from_str(QueueEnv.OVERFLOW_POLICY),
+                spill_dir=LogDirs.QUEUE_SPILL.value)
         self.q = q
-        for _ in range(Env.NUM_WORKERS):
-            thread = Thread(target=self.handle_status)
+        for name in ['depth', 'spill_depth', 'dropped', 'spilled']:
+            metrics.gauge(
+                f'queue_{name}', lambda name=name: self.q.stats()[name])
+        num_workers = int(num_workers)
+        if mode == 'process':
+            # Two feeding threads per process keep the processes busy
+            # while results are being sent
+            self.pool = ProcessTweetPool(num_workers)
+            targets = [self.handle_status_batches] * 2 * num_workers
+        else:
+            self.pool = None
+            targets = [self.handle_status] * num_workers
+        self.threads = []
+        for target in targets:
+            thread = Thread(target=target)
             thread.daemon = True
             thread.start()
+            self.threads.append(thread)
 
-    def on_status(self, status):
-        # Put to the queue
-        self.q.put(status)
+    def on_data(self, raw_data):
+        # Statuses are put to the queue unparsed, so that the reader
+        # keeps up with the stream. Everything else is left to tweepy.
+        if '"in_reply_to_status_id"' in raw_data:
+            self.q.put(raw_data)
+            return True
+        return super().on_data(raw_data)
 
     def handle_status(self):
         while True:
-            status = self.q.get()
+            raw_data = self.q.get()
+            start = time.perf_counter()
             try:
-                handle_tweet(status._json, config_manager)
+                handle_tweet(jsoncodec.loads(raw_data), self.config_manager)
             except KeyError as exc:
                 logger.error(
-                    '%s: %s\n%s',
-                    type(exc).__name__, str(exc), json.dumps(status._json))
+                    '%s: %s\n%s', type(exc).__name__, str(exc), raw_data)
                 raise exc
+            finally:
+                elapsed = time.perf_counter() - start
+                metrics.timing('handle', elapsed)
+                metrics.busy(elapsed)
             self.q.task_done()
 
+    def handle_status_batches(self):
+        while True:
+            raw_statuses = self.q.get_batch(WorkerEnv.PROCESS_BATCH_SIZE)
+            try:
+                records, raw_metrics = self.pool.process(
+                    raw_statuses, self.config_manager)
+                metrics.merge(raw_metrics)
+                dispatch(records)
+            except Exception as exc:
+                logger.error(
+                    'Worker process exception %s: %s. Lost %d status(es).',
+                    type(exc).__name__, str(exc), len(raw_statuses))
+            for _ in raw_statuses:
+                self.q.task_done()
+
     def on_error(self, status_code):
         if status_code in ERROR_CODES:
             logger.error(
@@ -1,27 +1,113 @@
 import logging
-import os
-import json
+import time
+import threading
 
 from twiprocess.processtweet import ProcessTweet
+from awstools import jsoncodec
 from awstools.env import Env, KFEnv
 from awstools.config import StorageMode
-from awstools.firehose import firehose
+from awstools.firehose import BatchSender
 
+from .env import SpillEnv, LocalStoreEnv
+from .metrics import metrics
 from .setup_logging import LogDirs
+from .spill import SpillLog
+from .utils.segment_writer import SegmentWriter
 from .utils.match_keywords import match_keywords
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
+# Fields added to the statuses sent to a project's delivery stream
+PROJECT_FIELDS = ('project', 'matching_keywords')
 
-def handle_tweet(
+# Created on first use, in the main process only: worker processes
+# import this module for process_tweet and must not open their own
+# spill log and local stores on the same files
+_lock = threading.Lock()
+_spill_log = None
+_sender = None
+_local_stores = None
+
+
+def get_spill_log():
+    """Returns the log of records Firehose did not accept, which are
+    kept on disk and sent later.
+    """
+    global _spill_log
+    with _lock:
+        if _spill_log is None:
+            _spill_log = SpillLog(
+                LogDirs.FIREHOSE_SPILL.value,
+                max_segment_bytes=SpillEnv.MAX_SEGMENT_BYTES,
+                replay_interval=SpillEnv.REPLAY_INTERVAL,
+                replay_rate=SpillEnv.REPLAY_RATE)
+        return _spill_log
+
+
+def get_sender():
+    """Returns the sender shared by all workers, records get grouped
+    per delivery stream.
+    """
+    global _sender
+    spill_log = get_spill_log()
+    with _lock:
+        if _sender is None:
+            _sender = BatchSender(
+                on_failure=spill_log.write, on_send=_on_send)
+        return _sender
+
+
+def _on_send(stream_name, n_records, seconds):
+    metrics.timing('send', seconds)
+
+
+def get_local_stores():
+    """Returns the writers of statuses stored on local disk, in rolling
+    segments shared by all workers.
+    """
+    global _local_stores
+    with _lock:
+        if _local_stores is None:
+            _local_stores = {
+                log_dir: SegmentWriter(
+                    log_dir.value, log_dir.name.lower(),
+                    max_bytes=LocalStoreEnv.MAX_SEGMENT_BYTES,
+                    max_age=LocalStoreEnv.MAX_SEGMENT_AGE)
+                for log_dir in [LogDirs.UNMATCHED, LogDirs.MATCH_TEST]}
+        return _local_stores
+
+
+def __getattr__(name):
+    # The module attributes `spill_log`, `sender` and `local_stores`
+    # are still available (PEP 562)
+    if name == 'spill_log':
+        return get_spill_log()
+    if name == 'sender':
+        return get_sender()
+    if name == 'local_stores':
+        return get_local_stores()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def process_tweet(
         status, config_manager,
         store_for_testing=False
 ):
-    tweet = ProcessTweet(status)
+    """Matches a status against all projects.
+
+    Returns the records (destination, data) to send, where destination
+    is the name of a delivery stream or, for statuses stored locally,
+    a key of `local_stores`.
+    """
+    records = []
+    metrics.count('tweets')
+    with metrics.timer('process_tweet'):
+        tweet = ProcessTweet(status)
     status_id = tweet.id
     # Reverse match to find project
-    matching_keywords = match_keywords(tweet, config_manager.config)
+    with metrics.timer('match'):
+        matching_keywords = match_keywords(tweet, config_manager.config)
     matching_projects = list(matching_keywords.keys())
     if matching_projects == []:
         # Could not match keywords.
@@ -30,18 +116,20 @@ def handle_tweet(
         logger.debug(
             'Status %s could not be matched against any existing projects.',
             status_id)
+        data = None
         if Env.UNMATCHED_STORE_LOCALLY == 1:
-            # Store to a separate file for later analysis
-            with open(os.path.join(
-                    LogDirs.UNMATCHED.value, f"{status_id}.json"
-            ), 'w') as f:
-                json.dump(status, f)
+            # Store locally for later analysis
+            data = jsoncodec.dumps_line(status)
+            records.append((LogDirs.UNMATCHED, data))
         if Env.UNMATCHED_STORE_S3 == 1:
-            _ = firehose.put_record(
-                DeliveryStreamName=f'{KFEnv.APP_NAME}-'
-                                   f'{KFEnv.UNMATCHED_STREAM_NAME}',
-                Record={'Data': f'{json.dumps(status)}\n'.encode()})
-        return
+            if data is None:
+                with metrics.timer('serialize'):
+                    data = jsoncodec.dumps_line(status)
+            records.append((
+                f'{KFEnv.APP_NAME}-{KFEnv.UNMATCHED_STREAM_NAME}',
+                data))
+            metrics.count(f'tweets.{KFEnv.UNMATCHED_STREAM_NAME}')
+        return records
 
     logger.debug(
         'SUCCESS: Found %d project(s) %s that match this status.',
@@ -49,24 +137,17 @@ def handle_tweet(
 
     if store_for_testing:
         # Store for testing
-        with open(os.path.join(
-                LogDirs.MATCH_TEST.value, f"{status_id}.json"
-        ), 'w') as f:
-            json.dump(status, f)
+        records.append((LogDirs.MATCH_TEST, jsoncodec.dumps_line(status)))
 
+    # The status is serialized only once, project fields are spliced in
+    serialized = None
+    serialize_time = 0.
     for slug in matching_projects:
         # Get config
         conf = config_manager.get_conf_by_slug(slug)
         if conf.storage_mode == StorageMode.TEST_MODE:
             logger.debug('Running in test mode. Not sending to S3.')
-            return
-
-        # Add tracking info
-        # 19.01.2021: lang, slug and matching_keywords are there anyway,
-        # and there's no point to store all keywords in every tweet
-        # status['_tracking_info'] = config_manager.get_tracking_info(slug)
-        status['project'] = slug
-        status['matching_keywords'] = matching_keywords.get(slug)
+            continue
 
         if conf.storage_mode in [StorageMode.S3, StorageMode.S3_ES,
                                  StorageMode.S3_NO_RETWEETS,
@@ -76,13 +157,74 @@ def handle_tweet(
                 StorageMode.S3_ES_NO_RETWEETS
             ]:
                 # Do not store retweets
-                return
+                continue
+            start = time.perf_counter()
+            if serialized is None:
+                serialized = jsoncodec.dumps(without_project_fields(status))
+            # Add tracking info
+            # 19.01.2021: lang, slug and matching_keywords are there anyway,
+            # and there's no point to store all keywords in every tweet
+            # status['_tracking_info'] = config_manager.get_tracking_info(slug)
+            data = splice_project_fields(
+                serialized, slug, matching_keywords.get(slug))
+            serialize_time += time.perf_counter() - start
             # Send to the corresponding delivery stream
             stream_name = f'{KFEnv.APP_NAME}-{slug}'
-            _ = firehose.put_record(
-                DeliveryStreamName=stream_name,
-                Record={'Data': f'{json.dumps(status)}\n'.encode()})
+            records.append((stream_name, data))
+            metrics.count(f'tweets.{slug}')
 
             logger.debug(
-                'Pushed processed with id %s to stream %s.',
+                'Processed status with id %s for stream %s.',
                 status_id, stream_name)
+    if serialized is not None:
+        metrics.timing('serialize', serialize_time)
+    return records
+
+
+def without_project_fields(status):
+    """Returns status without the fields splice_project_fields adds."""
+    if not any(field in status for field in PROJECT_FIELDS):
+        return status
+    return {
+        key: value for key, value in status.items()
+        if key not in PROJECT_FIELDS}
+
+
+def splice_project_fields(serialized, slug, matching_keywords):
+    """Adds project and matching_keywords to a serialized status.
+
+    Gives the same output as serializing the status with both fields
+    set last, without serializing the whole status again. The status
+    must have been serialized without these fields (see
+    without_project_fields), or they would be duplicated.
+    """
+    separator = b',' if serialized != b'{}' else b''
+    return b''.join([
+        serialized[:-1], separator,
+        b'"project":', jsoncodec.dumps(slug),
+        b',"matching_keywords":', jsoncodec.dumps(matching_keywords),
+        b'}\n'])
+
+
+def handle_tweet(
+        status, config_manager,
+        store_for_testing=False
+):
+    dispatch(process_tweet(status, config_manager, store_for_testing))
+
+
+def dispatch(records):
+    """Sends records to their delivery stream or local store."""
+    sender = get_sender()
+    for destination, data in records:
+        if isinstance(destination, LogDirs):
+            get_local_stores()[destination].write(data)
+        else:
+            sender.put(destination, data)
+
+
+def close_local_stores():
+    if _local_stores is None:
+        return
+    for writer in _local_stores.values():
+        writer.close()
@@ -4,44 +4,130 @@ keyword lists and languages.
 """
 
 import logging
-import re
-from collections import defaultdict
+from collections import defaultdict, deque
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
 
+class AhoCorasick():
+    """Finds all occurrences of a fixed set of words in a single pass."""
+    def __init__(self, words):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [set()]
+        for word in words:
+            self._add(word)
+        self._build()
+
+    def find(self, text):
+        """Returns the set of words contained in text (as substrings)."""
+        goto, fail, output = self.goto, self.fail, self.output
+        state = 0
+        found = set()
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found.update(output[state])
+        return found
+
+    def _add(self, word):
+        state = 0
+        for char in word:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append(set())
+            state = next_state
+        self.output[state].add(word)
+
+    def _build(self):
+        """Computes failure links breadth-first."""
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fail = self.fail[state]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                self.fail[next_state] = self.goto[fail].get(char, 0)
+                self.output[next_state] |= self.output[self.fail[next_state]]
+        self.output = [frozenset(output) for output in self.output]
+
+
+class KeywordMatcher():
+    """Keyword index over all projects of a config.
+
+    Single-word keywords are matched as substrings of the text,
+    multi-word keywords match if all of their words are contained
+    in the text.
+    """
+    def __init__(self, config):
+        self.config = config
+        self._langs = [set(conf.lang) for conf in config]
+        # word -> [(conf index, keyword index, keyword)]
+        self._single = defaultdict(list)
+        # word -> [((conf index, keyword index, keyword), words)]
+        self._multi = defaultdict(list)
+        for conf_i, conf in enumerate(config):
+            for kw_i, keyword in enumerate(conf.keywords):
+                keyword_list = keyword.lower().split()
+                if len(keyword_list) == 0:
+                    continue
+                hit = (conf_i, kw_i, ' '.join(keyword_list))
+                if len(keyword_list) == 1:
+                    self._single[keyword_list[0]].append(hit)
+                else:
+                    words = frozenset(keyword_list)
+                    for word in words:
+                        self._multi[word].append((hit, words))
+        self._automaton = AhoCorasick(
+            set(self._single.keys()) | set(self._multi.keys()))
+
+    def match(self, tweet):
+        """Returns {slug: [keywords]} for all projects matching tweet."""
+        found = self._automaton.find(tweet.keyword_matching_text)
+        if not found:
+            return {}
+        hits = set()
+        for word in found:
+            hits.update(self._single.get(word, ()))
+            for hit, words in self._multi.get(word, ()):
+                if words <= found:
+                    hits.add(hit)
+        matching_keywords = {}
+        for conf_i, _, keyword in sorted(hits):
+            if self._lang_matches(tweet.lang, conf_i):
+                matching_keywords.setdefault(
+                    self.config[conf_i].slug, []).append(keyword)
+        return matching_keywords
+
+    def _lang_matches(self, lang, conf_i):
+        langs = self._langs[conf_i]
+        return lang in langs or len(langs) == 0 or lang == 'und'
+
+
+_matcher = None
+
+
+def get_matcher(config):
+    """Returns the matcher for config, building it only once per config."""
+    global _matcher
+    matcher = _matcher
+    if matcher is None or matcher.config is not config:
+        matcher = KeywordMatcher(config)
+        _matcher = matcher
+        logger.info(
+            'Built keyword matcher for %d project(s).', len(config))
+    return matcher
+
+
 def match_keywords(tweet, config):
     """For each project in config, match project keywords with text."""
-    matching_keywords = defaultdict(list)
-    for conf in config:
-        matching_keywords = {
-            **matching_keywords,
-            **_match_to_conf_keywords(tweet, conf)}
-    return matching_keywords
-
-
-def _match_to_conf_keywords(tweet, conf):
-    """Match project keywords with text."""
-    # Filter by language setting
-    if tweet.lang in conf.lang or \
-            len(conf.lang) == 0 or tweet.lang == 'und':
-        matching_keywords = defaultdict(list)
-        keywords = [kw.lower().split() for kw in conf.keywords]
-        for keyword_list in keywords:
-            if len(keyword_list) == 1:
-                if keyword_list[0] in tweet.keyword_matching_text:
-                    matching_keywords[conf.slug].append(
-                        keyword_list[0])
-            else:
-                # Keywords with more than one word:
-                # Check if all words are contained in text
-                match_result = re.findall(
-                    r'{}'.format(
-                        '|'.join(keyword_list)), tweet.keyword_matching_text)
-                if set(match_result) == set(keyword_list):
-                    matching_keywords[conf.slug].append(
-                        ' '.join(keyword_list))
-        return matching_keywords
-    else:
-        return {}
+    return get_matcher(config).match(tweet)
@@ -0,0 +1,134 @@
+"""
+Append-only, gzip compressed segment files of newline delimited records.
+"""
+
+import logging
+import os
+import gzip
+import time
+import threading
+import zlib
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+OPEN_SUFFIX = '.open'
+
+
+class SegmentWriter():
+    """Writes lines to gzip segments, rotated by size and/or age.
+
+    The segment being written has an `.open` suffix, which is removed
+    once the segment is rotated. Segments left open by a crashed
+    process are closed when a new writer is created, so that they are
+    listed by `segments()` right away.
+    One writer can be shared by several threads.
+    """
+    def __init__(
+        self, directory, prefix,
+        max_bytes=64 * 1024 ** 2, max_age=None, compresslevel=6
+    ):
+        self.directory = directory
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.compresslevel = compresslevel
+        self._lock = threading.RLock()
+        self._file = None
+        self._path = None
+        self._opened = None
+        self._bytes = 0
+        self._seq = 0
+        self._recover()
+
+    def write(self, data):
+        """Appends data, one or more complete lines, to the segment."""
+        with self._lock:
+            if self._file is None:
+                self._open()
+            elif self._should_rotate():
+                self.rotate()
+                self._open()
+            self._file.write(data)
+            self._bytes += len(data)
+
+    def flush(self, sync=False):
+        """Makes written data readable, and durable if sync is True."""
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.flush()
+            if sync:
+                os.fsync(self._file.fileno())
+            if self._should_rotate():
+                self.rotate()
+
+    def rotate(self):
+        """Closes the current segment, returns its path."""
+        with self._lock:
+            if self._file is None:
+                return None
+            self._file.close()
+            path = self._path[:-len(OPEN_SUFFIX)]
+            os.rename(self._path, path)
+            self._file = None
+            self._path = None
+            logger.debug('Closed segment %s.', path)
+            return path
+
+    def close(self):
+        return self.rotate()
+
+    def segments(self):
+        """Paths of closed segments, oldest first."""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(
+            os.path.join(self.directory, name)
+            for name in os.listdir(self.directory)
+            if name.startswith(self.prefix) and name.endswith('.jsonl.gz'))
+
+    def _open(self):
+        Path(self.directory).mkdir(parents=True, exist_ok=True)
+        self._seq += 1
+        # With the pid, writers of several processes never share a name
+        name = '{}-{}-{}-{:06d}.jsonl.gz'.format(
+            self.prefix, time.strftime('%Y%m%d%H%M%S'), os.getpid(),
+            self._seq)
+        self._path = os.path.join(self.directory, name + OPEN_SUFFIX)
+        self._file = gzip.open(
+            self._path, 'wb', compresslevel=self.compresslevel)
+        self._opened = time.time()
+        self._bytes = 0
+
+    def _recover(self):
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if name.startswith(self.prefix) and name.endswith(OPEN_SUFFIX):
+                path = os.path.join(self.directory, name)
+                os.rename(path, path[:-len(OPEN_SUFFIX)])
+                logger.info('Recovered segment %s.', name)
+
+    def _should_rotate(self):
+        if self.max_bytes and self._bytes >= self.max_bytes:
+            return True
+        return self.max_age is not None and \
+            time.time() - self._opened >= self.max_age
+
+
+def read_segment(path):
+    """Yields the lines of a segment.
+
+    Stops at the last complete line of a segment truncated by a crash.
+    """
+    try:
+        with gzip.open(path, 'rb') as f:
+            for line in f:
+                if line.endswith(b'\n'):
+                    yield line
+    except (EOFError, zlib.error, gzip.BadGzipFile) as exc:
+        logger.warning(
+            'Segment %s is truncated (%s: %s).',
+            path, type(exc).__name__, str(exc))
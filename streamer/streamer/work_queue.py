@@ -0,0 +1,230 @@
+import logging
+import os
+import time
+import threading
+from collections import deque
+from enum import Enum
+from pathlib import Path
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+
+class OverflowPolicy(Enum):
+    BLOCK = 1
+    DROP_OLDEST = 2
+    SPILL = 3
+
+    @classmethod
+    def from_str(cls, name):
+        return cls[name.upper().replace('-', '_')]
+
+
+def item_size(item):
+    """Size of a queued item in bytes, as received."""
+    return len(item.encode('utf-8')) if isinstance(item, str) else len(item)
+
+
+class SpillFile():
+    """Append-only file of queue items that did not fit into memory.
+
+    Has its own lock, so that the queue does not hold its lock
+    during disk I/O.
+    """
+    def __init__(self, directory):
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        self.path = os.path.join(directory, 'queue.jsonl')
+        self._lock = threading.Lock()
+        self._writer = open(self.path, 'a', encoding='utf-8')
+        self._reader = open(self.path, 'r', encoding='utf-8')
+        # Items left over from a previous run are kept
+        self.pending = sum(1 for _ in self._reader)
+        self._reader.seek(0)
+        if self.pending:
+            logger.info(
+                'Found %d spilled item(s) from a previous run.', self.pending)
+
+    def write(self, item):
+        with self._lock:
+            self._writer.write(item.strip() + '\n')
+            self.pending += 1
+
+    def read(self, n):
+        with self._lock:
+            self._writer.flush()
+            items = []
+            while len(items) < n and self.pending:
+                items.append(self._reader.readline().rstrip('\n'))
+                self.pending -= 1
+            if self.pending == 0:
+                # Everything has been read back, start over
+                self._writer.truncate(0)
+                self._reader.seek(0)
+            return items
+
+    def close(self):
+        self._writer.close()
+        self._reader.close()
+
+
+class WorkQueue():
+    """Bounded queue of raw statuses with a configurable overflow policy.
+
+    Capacity is given in items and/or bytes (0 means unlimited).
+    When the queue is full, `put` either blocks the reader, drops the
+    oldest items or spills new items to local disk until the workers
+    catch up. Spilled items are written and read back outside of the
+    queue lock.
+    """
+    # Number of spilled items read back at once
+    SPILL_READ_SIZE = 1000
+
+    def __init__(
+        self, max_items=0, max_bytes=0,
+        policy=OverflowPolicy.BLOCK, spill_dir=None
+    ):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self._items = deque()
+        self._bytes = 0
+        self._unfinished = 0
+        self._mutex = threading.Lock()
+        self._not_empty = threading.Condition(self._mutex)
+        self._not_full = threading.Condition(self._mutex)
+        self._all_done = threading.Condition(self._mutex)
+        self._spill = None
+        # Spilled items not read back yet, and those written to disk
+        self._spill_queued = 0
+        self._spill_written = 0
+        self._refilling = False
+        if policy == OverflowPolicy.SPILL:
+            self._spill = SpillFile(spill_dir)
+            self._unfinished = self._spill.pending
+            self._spill_queued = self._spill_written = self._spill.pending
+        self.dropped = 0
+        self.spilled = 0
+
+    def put(self, item, size=None):
+        """Queues an item of size bytes (by default measured)."""
+        size = item_size(item) if size is None else size
+        with self._not_full:
+            spill = self._spill is not None and \
+                (self._spill_queued or self._is_full(size))
+            if spill:
+                # Keep the order, once spilling all new items go to disk
+                self._spill_queued += 1
+                self.spilled += 1
+            else:
+                if self.policy == OverflowPolicy.BLOCK:
+                    while self._is_full(size):
+                        self._not_full.wait()
+                elif self.policy == OverflowPolicy.DROP_OLDEST:
+                    while self._is_full(size) and self._items:
+                        _, dropped_size, _ = self._items.popleft()
+                        self._bytes -= dropped_size
+                        self._unfinished -= 1
+                        self.dropped += 1
+                self._items.append((item, size, time.perf_counter()))
+                self._bytes += size
+                self._not_empty.notify()
+            self._unfinished += 1
+        if spill:
+            self._spill.write(item)
+            with self._not_empty:
+                self._spill_written += 1
+                self._not_empty.notify()
+
+    def get(self):
+        while True:
+            with self._not_empty:
+                while not self._items and \
+                        (not self._spill_written or self._refilling):
+                    self._not_empty.wait()
+                if self._items:
+                    item, size, put_time = self._items.popleft()
+                    self._bytes -= size
+                    self._not_full.notify()
+                    break
+                # Only one getter reads back, to keep the order
+                self._refilling = True
+            self._refill()
+        if put_time is not None:
+            metrics.timing('queue_wait', time.perf_counter() - put_time)
+        return item
+
+    def get_batch(self, max_items):
+        """Waits for an item, then takes up to max_items queued items,
+        reading spilled items back as `get` does.
+        """
+        items = [self.get()]
+        while True:
+            now = time.perf_counter()
+            with self._mutex:
+                while len(items) < max_items and self._items:
+                    item, size, put_time = self._items.popleft()
+                    self._bytes -= size
+                    items.append(item)
+                    if put_time is not None:
+                        metrics.timing('queue_wait', now - put_time)
+                self._not_full.notify_all()
+                if len(items) >= max_items or not self._spill_written or \
+                        self._refilling:
+                    return items
+                self._refilling = True
+            self._refill()
+
+    def task_done(self):
+        with self._all_done:
+            self._unfinished -= 1
+            if self._unfinished <= 0:
+                self._all_done.notify_all()
+
+    def join(self, timeout=None):
+        """Waits until all items are processed, returns False if they
+        are not after `timeout` seconds.
+        """
+        with self._all_done:
+            return self._all_done.wait_for(
+                lambda: self._unfinished <= 0, timeout)
+
+    def qsize(self):
+        with self._mutex:
+            return len(self._items) + self._spilled_pending()
+
+    def stats(self):
+        with self._mutex:
+            return {
+                'depth': len(self._items),
+                'bytes': self._bytes,
+                'spill_depth': self._spilled_pending(),
+                'dropped': self.dropped,
+                'spilled': self.spilled}
+
+    def _spilled_pending(self):
+        return self._spill_queued
+
+    def _refill(self):
+        """Reads spilled items back into memory."""
+        items = []
+        try:
+            items = self._spill.read(self.SPILL_READ_SIZE)
+        finally:
+            with self._not_empty:
+                for item in items:
+                    size = item_size(item)
+                    self._items.append((item, size, None))
+                    self._bytes += size
+                self._spill_queued -= len(items)
+                self._spill_written -= len(items)
+                self._refilling = False
+                self._not_empty.notify_all()
+
+    def _is_full(self, size):
+        if not self._items:
+            # Always accept a single item, however large
+            return False
+        return (self.max_items and len(self._items) >= self.max_items) or \
+            (self.max_bytes and self._bytes + size > self.max_bytes)
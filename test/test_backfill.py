@@ -0,0 +1,147 @@
+from types import SimpleNamespace
+from collections import Counter
+
+import pytest
+
+pytest.importorskip('boto3')
+
+from awstools import jsoncodec  # noqa
+from awstools.env import AWSEnv  # noqa
+from awstools.backfill import backfill, Checkpoint  # noqa
+
+
+class FakeS3Client():
+    """Lists keys, two per page."""
+    def __init__(self, keys):
+        self.keys = keys
+
+    def list_objects_v2(self, Bucket, Prefix, ContinuationToken=0):
+        keys = [key for key in self.keys if key.startswith(Prefix)]
+        page = keys[ContinuationToken:ContinuationToken + 2]
+        response = {'Contents': [{'Key': key} for key in page]}
+        if ContinuationToken + 2 < len(keys):
+            response.update(
+                IsTruncated=True, NextContinuationToken=ContinuationToken + 2)
+        return response
+
+
+class FakeProject():
+    index_name = 'project_slug_1'
+
+
+class FakePipeline():
+    """Indexes one document per object, fails the keys in `failing`."""
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.indexed = []
+
+    def project(self, slug, index_name=None):
+        return FakeProject()
+
+    def index_object(self, bucket, key, project):
+        if key in self.failing:
+            raise RuntimeError('ES is down')
+        self.indexed.append(key)
+        return Counter(created=1, exists=0, mapping_error=0, failed=0)
+
+
+def test_resume_from_checkpoint(tmp_path):
+    prefix = f'{AWSEnv.STORAGE_BUCKET_PREFIX}slug/'
+    keys = [f'{prefix}{i}.gz' for i in range(5)]
+    s3_client = FakeS3Client(keys + ['other/0.gz'])
+    checkpoint = Checkpoint(str(tmp_path / 'index.done'))
+
+    pipeline = FakePipeline(failing=[keys[3]])
+    totals = backfill(
+        'slug', pipeline=pipeline, checkpoint=checkpoint, max_workers=2,
+        s3_client=s3_client)
+    assert sorted(pipeline.indexed) == keys[:3] + keys[4:], \
+        'All objects of the project should be indexed'
+    assert totals['objects_done'] == 4 and totals['objects_failed'] == 1, \
+        'Failed objects should be counted'
+
+    pipeline = FakePipeline()
+    totals = backfill(
+        'slug', pipeline=pipeline,
+        checkpoint=Checkpoint(str(tmp_path / 'index.done')),
+        s3_client=s3_client)
+    assert pipeline.indexed == [keys[3]], \
+        'Only the failed object should be indexed again'
+    assert totals['objects_skipped'] == 4, 'Done objects should be skipped'
+
+
+def status(i, location):
+    return {
+        'id': i, 'id_str': str(i), 'text': f'Tweet {i}', 'lang': 'en',
+        'created_at': 'Wed Oct 10 20:19:24 +0000 2018',
+        'user': {'id': 1, 'id_str': '1', 'screen_name': 'user',
+                 'name': 'User', 'location': location},
+        'entities': {'hashtags': [], 'urls': [], 'user_mentions': []}}
+
+
+class FakeSelectClient(FakeS3Client):
+    """Answers S3 Select queries with objects of JSON lines."""
+    def __init__(self, objects):
+        super().__init__(list(objects))
+        self.objects = objects
+
+    def select_object_content(self, Bucket, Key, **kwargs):
+        data = b''.join(jsoncodec.dumps_line(status)
+                        for status in self.objects[Key])
+        # Lines are split across payloads
+        return {'Payload': [
+            {'Records': {'Payload': data[i:i + 100]}}
+            for i in range(0, len(data), 100)] + [{'End': {}}]}
+
+
+class FakeES():
+    """Creates all documents, remembers them per index."""
+    def __init__(self):
+        self.created = {}
+
+    def bulk(self, body, index, doc_type):
+        lines = body.splitlines()
+        ids = [jsoncodec.loads(line)['create']['_id'] for line in lines[::2]]
+        self.created.setdefault(index, []).extend(ids)
+        return {'items': [
+            {'create': {'_id': doc_id, 'status': 201}} for doc_id in ids]}
+
+
+class FakeConfigManager():
+    def get_conf_by_slug(self, slug):
+        return SimpleNamespace(model_endpoints=None, extract_geo=True)
+
+
+class FakeGeocode():
+    def decode(self, location):
+        return []
+
+
+def test_backfill_pipeline(tmp_path):
+    pytest.importorskip('twiprocess')
+    pytest.importorskip('elasticsearch')
+    from awstools.pipeline import Pipeline
+    from awstools.elasticsearch import BulkIndexer
+    from awstools.geo import CachedGeocode
+
+    prefix = f'{AWSEnv.STORAGE_BUCKET_PREFIX}slug/'
+    objects = {
+        f'{prefix}0.gz': [status(i, 'London') for i in range(5)],
+        f'{prefix}1.gz': [status(i, 'Zürich') for i in range(5, 7)]}
+    es = FakeES()
+    pipeline = Pipeline(
+        scheduler=object(), indexer=BulkIndexer(es),
+        geo_code=CachedGeocode(load=FakeGeocode),
+        s3_client=FakeSelectClient(objects),
+        config_manager=FakeConfigManager(), chunk_size=3)
+    checkpoint = Checkpoint(str(tmp_path / 'index.done'))
+
+    totals = backfill(
+        'slug', 'project_slug_2', pipeline=pipeline, checkpoint=checkpoint,
+        s3_client=pipeline.s3_client)
+    assert {str(doc_id) for doc_id in es.created['project_slug_2']} == \
+        {str(i) for i in range(7)}, \
+        'All tweets should be indexed into the given index'
+    assert totals['created'] == 7 and totals['objects_done'] == 2
+    assert Checkpoint(checkpoint.path).done == set(objects), \
+        'Indexed objects should be checkpointed'
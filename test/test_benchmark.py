@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+pytest.importorskip('boto3')
+pytest.importorskip('dacite')
+pytest.importorskip('tweepy')
+pytest.importorskip('twiprocess')
+
+from awstools.config import ConfigManager  # noqa
+from awstools.env import Env  # noqa
+from streamer import stream, tasks  # noqa
+from streamer.benchmark import run_benchmark  # noqa
+from streamer.spill import SpillLog  # noqa
+
+TEXTS = ['Rain in Zurich', 'Zurich again', 'Snow in Basel', 'zurich',
+         'Nothing to see']
+
+
+@pytest.fixture
+def corpus():
+    return [json.dumps({
+        'id': i, 'id_str': str(i), 'text': text, 'lang': 'en',
+        'in_reply_to_status_id': None, 'user': {'location': None}})
+        for i, text in enumerate(TEXTS)]
+
+
+@pytest.fixture
+def config_manager():
+    return ConfigManager(raw=[{
+        'keywords': ['zurich'],
+        'lang': ['en'],
+        'locales': ['en'],
+        'slug': 'project',
+        'es_index_name': 'project',
+        'storage_mode': 's3',
+        'image_storage_mode': 'inactive',
+        'model_endpoints': {}}])
+
+
+@pytest.fixture(autouse=True)
+def sender(monkeypatch, tmp_path):
+    """Fresh sender, failed records are spilled to a temporary dir."""
+    monkeypatch.setattr(tasks, '_spill_log', SpillLog(str(tmp_path)))
+    monkeypatch.setattr(tasks, '_sender', None)
+
+
+def test_run_benchmark(corpus, config_manager):
+    report = run_benchmark(
+        corpus, config_manager, num_workers=2, mode='thread', repeat=2)
+    assert report['tweets'] == 10, 'Replayed tweets should be counted'
+    # 3 of 5 tweets match, the others go to the unmatched stream if set
+    n_unmatched = 4 if Env.UNMATCHED_STORE_S3 == 1 else 0
+    assert report['records_sent'] == 6 + n_unmatched, \
+        'Matching tweets should be sent to Firehose'
+    assert report['bytes_sent'] > 0 and report['tweets_per_second'] > 0
+    assert 'handle' in report['stages_ms'] and 'match' in report['stages_ms']
+
+
+def test_run_benchmark_worker_dies(corpus, config_manager, monkeypatch):
+    def handle_tweet(status, config_manager):
+        raise KeyError('id')
+
+    monkeypatch.setattr(stream, 'handle_tweet', handle_tweet)
+    with pytest.raises(RuntimeError) as info:
+        run_benchmark(corpus, config_manager, num_workers=1, mode='thread')
+    assert isinstance(info.value.__cause__, KeyError), \
+        'The exception of the worker should be raised, not waited on'
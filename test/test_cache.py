@@ -0,0 +1,58 @@
+import io
+
+import pytest
+
+pytest.importorskip('botocore')
+
+from botocore.exceptions import ClientError  # noqa
+from awstools.cache import DocumentCache  # noqa
+
+
+class FakeS3Client():
+    def __init__(self, body, etag):
+        self.body = body
+        self.etag = etag
+        self.downloads = 0
+
+    def get_object(self, Bucket, Key, IfNoneMatch=None):
+        if IfNoneMatch == self.etag:
+            raise ClientError(
+                {'Error': {'Code': '304', 'Message': 'Not Modified'}},
+                'GetObject')
+        self.downloads += 1
+        return {'Body': io.BytesIO(self.body), 'ETag': self.etag}
+
+
+def test_fresh_documents_are_not_fetched():
+    client = FakeS3Client(b'{"a": 1}', '"1"')
+    cache = DocumentCache(ttl=60, s3_client=client)
+    assert cache.get('bucket', 'key') == {'a': 1}
+    assert cache.get('bucket', 'key') == {'a': 1}
+    assert client.downloads == 1, 'Document should be cached'
+
+
+def test_expired_documents_are_revalidated():
+    client = FakeS3Client(b'{"a": 1}', '"1"')
+    cache = DocumentCache(ttl=0, s3_client=client)
+    cache.get('bucket', 'key')
+    assert cache.get('bucket', 'key') == {'a': 1}
+    assert client.downloads == 1, 'Unchanged document should not be fetched'
+    client.body, client.etag = b'{"a": 2}', '"2"'
+    assert cache.get('bucket', 'key') == {'a': 2}, 'Changes should be seen'
+
+
+def test_invalidate():
+    client = FakeS3Client(b'{"a": 1}', '"1"')
+    cache = DocumentCache(ttl=60, s3_client=client)
+    cache.get('bucket', 'key')
+    cache.invalidate('bucket', 'key')
+    cache.get('bucket', 'key')
+    assert client.downloads == 2, 'Invalidated document should be fetched'
+
+
+def test_documents_are_copies():
+    client = FakeS3Client(b'{"a": [1]}', '"1"')
+    cache = DocumentCache(ttl=60, s3_client=client)
+    cache.get('bucket', 'key')['a'].append(2)
+    assert cache.get('bucket', 'key') == {'a': [1]}, \
+        'Changes by callers should not reach the cache'
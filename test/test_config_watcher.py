@@ -0,0 +1,83 @@
+import pytest
+
+pytest.importorskip('boto3')
+pytest.importorskip('dacite')
+
+from streamer import config_watcher  # noqa
+from streamer.config_watcher import ConfigWatcher  # noqa
+
+
+class FakeConfigManager():
+    """Config manager of the config currently on S3."""
+    config = 'v1'
+
+    def __init__(self):
+        self.config = FakeConfigManager.config
+
+    def write(self):
+        return self.config
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    """ETag of the config on S3, an exception to make polling fail."""
+    state = {'etag': 'a', 'error': None}
+
+    def get_s3_object_etag(bucket, key):
+        if state['error'] is not None:
+            raise state['error']
+        return state['etag']
+
+    monkeypatch.setattr(config_watcher, 'get_s3_object_etag',
+                        get_s3_object_etag)
+    monkeypatch.setattr(config_watcher, 'ConfigManager', FakeConfigManager)
+    monkeypatch.setattr(FakeConfigManager, 'config', 'v1')
+    return state
+
+
+def test_reload_on_etag_change(s3):
+    changes = []
+    watcher = ConfigWatcher(
+        FakeConfigManager(),
+        on_change=lambda old, new: changes.append((old.config, new.config)))
+    assert watcher.poll() is False, 'An unchanged config is not reloaded'
+
+    s3['etag'] = 'b'
+    FakeConfigManager.config = 'v2'
+    assert watcher.poll() is True and changes == [('v1', 'v2')], \
+        'A changed config should be reloaded'
+    assert watcher.config_manager.config == 'v2', \
+        'The new config should be swapped in'
+
+
+def test_unchanged_etag(s3):
+    watcher = ConfigWatcher(FakeConfigManager())
+    assert watcher.poll() is False
+    FakeConfigManager.config = 'v2'
+    assert watcher.poll() is False and \
+        watcher.config_manager.config == 'v1', \
+        'The config should only be loaded when its ETag changed'
+
+
+def test_retry_after_poll_error(s3):
+    calls = []
+
+    def on_change(old, new):
+        calls.append(new)
+        if len(calls) == 1:
+            raise RuntimeError('Reload failed')
+
+    watcher = ConfigWatcher(FakeConfigManager(), on_change=on_change)
+    s3['error'] = RuntimeError('S3 is down')
+    with pytest.raises(RuntimeError):
+        watcher.poll()
+
+    s3['error'] = None
+    s3['etag'] = 'b'
+    FakeConfigManager.config = 'v2'
+    with pytest.raises(RuntimeError):
+        watcher.poll()
+    assert watcher.config_manager.config == 'v1'
+    assert watcher.poll() is True and \
+        watcher.config_manager.config == 'v2', \
+        'A failed reload should be retried on the next poll'
@@ -0,0 +1,49 @@
+import pytest
+
+pytest.importorskip('boto3')
+pytest.importorskip('elasticsearch')
+
+from awstools import jsoncodec  # noqa
+from awstools.elasticsearch import BulkIndexer  # noqa
+
+
+class FakeES():
+    """Answers bulk requests with the given item statuses, in turn."""
+    def __init__(self, *statuses):
+        self.statuses = list(statuses)
+        self.requests = []
+
+    def bulk(self, body, index, doc_type):
+        lines = body.splitlines()
+        ids = [jsoncodec.loads(line)['create']['_id'] for line in lines[::2]]
+        self.requests.append(ids)
+        statuses = self.statuses.pop(0)
+        return {'items': [
+            {'create': {'_id': doc_id, 'status': status}}
+            for doc_id, status in zip(ids, statuses)]}
+
+
+def test_results_are_classified():
+    es = FakeES([201, 409, 400, 404])
+    results = BulkIndexer(es).create(
+        'index', [(str(i), {'text': 'a'}) for i in range(4)])
+    assert results == {
+        'created': 1, 'exists': 1, 'mapping_error': 1, 'failed': 1}, \
+        'Each item should get a result'
+
+
+def test_only_retryable_items_are_retried():
+    es = FakeES([201, 429, 503], [201, 201])
+    results = BulkIndexer(es, backoff=0).create(
+        'index', [(str(i), {'text': 'a'}) for i in range(3)])
+    assert es.requests == [['0', '1', '2'], ['1', '2']], \
+        'Only rejected items should be sent again'
+    assert results['created'] == 3
+
+
+def test_chunks():
+    es = FakeES([201] * 2, [201] * 2, [201])
+    BulkIndexer(es, chunk_docs=2).create(
+        'index', [(str(i), {'text': 'a'}) for i in range(5)])
+    assert [len(ids) for ids in es.requests] == [2, 2, 1], \
+        'Chunks should have at most chunk_docs documents'
@@ -0,0 +1,34 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip('aenum')
+pytest.importorskip('dotenv')
+
+# Variables without default, all optional ones are left unset
+REQUIRED = {
+    'APP_NAME': 'test',
+    'AWS_ACCESS_KEY_ID': 'test',
+    'AWS_SECRET_ACCESS_KEY': 'test',
+    'AWS_ACCOUNT_NUM': '123456789012',
+    'AWS_KF_ROLE_TRUST_RELATIONSHIP_FILENAME': 'kf_role.json',
+    'AWS_KF_POLICY_FILENAME': 'kf_policy.json',
+    'AWS_L_ROLE_TRUST_RELATIONSHIP_FILENAME': 'l_role.json',
+    'ES_HOST': 'localhost',
+    'ES_PORT': '9200',
+}
+
+
+def test_import_with_defaults():
+    env = {**os.environ, **REQUIRED}
+    env.pop('AWS_L_GEOCODE_INDEX_PATH', None)
+    result = subprocess.run(
+        [sys.executable, '-c',
+         'from awstools.env import LEnv; '
+         "print(LEnv.GEOCODE_INDEX_PATH == '')"],
+        env=env, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == 'True', \
+        'The geocode index path should default to empty'
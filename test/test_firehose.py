@@ -0,0 +1,31 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('boto3')
+
+from awstools import firehose  # noqa
+
+
+class FakeFirehose():
+    exceptions = SimpleNamespace(
+        ResourceInUseException=type('ResourceInUseException',
+                                    (Exception,), {}),
+        InvalidArgumentException=type('InvalidArgumentException',
+                                      (Exception,), {}))
+
+    def create_delivery_stream(self, **kwargs):
+        pass
+
+
+@pytest.mark.parametrize('status', ['CREATING_FAILED', 'DELETING'])
+def test_failed_stream_is_not_waited_for(monkeypatch, status):
+    monkeypatch.setattr(
+        firehose, 'session', SimpleNamespace(firehose=FakeFirehose()))
+    monkeypatch.setattr(firehose, 'create_firehose_role', lambda slug: None)
+    monkeypatch.setattr(
+        firehose, 'get_delivery_stream_status', lambda stream_name: status)
+    monkeypatch.setattr(firehose.time, 'sleep', lambda seconds: pytest.fail(
+        'A failed delivery stream should not be waited for'))
+    with pytest.raises(RuntimeError, match=status):
+        firehose.create_delivery_stream('slug', 'slug/')
@@ -0,0 +1,94 @@
+import sys
+from types import ModuleType
+
+from awstools.geo import CachedGeocode, normalize_location, load_geocode
+from awstools.geoindex import build_index, GeocodeIndex
+
+
+class FakeGeocode():
+    """Decodes a location to one place named after it."""
+    def __init__(self):
+        self.decoded = []
+
+    def decode(self, location):
+        self.decoded.append(location)
+        return [{'name': location, 'country_code': 'XX'}]
+
+
+def cached_geocode(max_items=100):
+    geo_code = FakeGeocode()
+    return CachedGeocode(load=lambda: geo_code, max_items=max_items), \
+        geo_code
+
+
+def test_normalize_location():
+    assert normalize_location('  New\tYork \n CITY ') == 'new york city', \
+        'Case and whitespace should be normalized'
+    assert normalize_location('Zürich') == 'zürich', \
+        'Unicode should be normalized'
+
+
+def test_cache():
+    cache, geo_code = cached_geocode()
+    assert not cache.loaded, 'The geocoder should be loaded on first use'
+    assert cache.decode('London') == [{'name': 'london', 'country_code': 'XX'}]
+    assert cache.decode(' LONDON ') == cache.decode('london')
+    assert geo_code.decoded == ['london'], \
+        'A normalized location should be decoded once'
+
+    cache.decode('London')[0]['name'] = 'Paris'
+    assert cache.decode('London')[0]['name'] == 'london', \
+        'Results should be copies of the cached ones'
+
+
+def test_lru_eviction():
+    cache, geo_code = cached_geocode(max_items=2)
+    cache.decode('a')
+    cache.decode('b')
+    cache.decode('a')
+    cache.decode('c')
+    assert cache.stats()['size'] == 2
+    cache.decode('a')
+    cache.decode('b')
+    assert geo_code.decoded == ['a', 'b', 'c', 'b'], \
+        'The least recently used location should be evicted'
+
+
+def test_stats():
+    cache, geo_code = cached_geocode()
+    cache.decode_many(['Bern', ' bern', 'Basel', None, ''])
+    assert cache.stats() == {
+        'hits': 0, 'misses': 0, 'decodes': 2, 'size': 2}, \
+        'Prefetched locations should be decoded once, without lookups'
+    for location in ['Bern', 'Basel', 'Genf', 'genf']:
+        cache.decode(location)
+    cache.decode_many(['Bern', 'Genf', 'Chur'])
+    assert cache.stats() == {
+        'hits': 3, 'misses': 1, 'decodes': 4, 'size': 4}, \
+        'Lookups should be counted as hits or misses'
+    assert sorted(geo_code.decoded) == ['basel', 'bern', 'chur', 'genf']
+
+
+class FakeGeocodePackage(FakeGeocode):
+    """Geocode of the local-geocode package, loaded from its pickle."""
+    def load(self):
+        self.loaded = True
+
+
+def test_load_geocode(tmp_path, monkeypatch):
+    path = build_index(
+        [['Bern', 'Bern', 'CH', 7.44, 46.95, '2661552', 'city', 121631]],
+        str(tmp_path / 'geonames.idx'))
+    geo_code = load_geocode(path)
+    assert isinstance(geo_code, GeocodeIndex) and \
+        geo_code.decode('bern')[0]['name'] == 'Bern', \
+        'The index should be used when it exists'
+    geo_code.close()
+
+    module = ModuleType('geocode.geocode')
+    module.Geocode = FakeGeocodePackage
+    monkeypatch.setitem(sys.modules, 'geocode', ModuleType('geocode'))
+    monkeypatch.setitem(sys.modules, 'geocode.geocode', module)
+    geo_code = load_geocode(str(tmp_path / 'missing.idx'))
+    assert isinstance(geo_code, FakeGeocodePackage) and geo_code.loaded, \
+        'Geocode should be loaded without index'
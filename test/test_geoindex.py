@@ -0,0 +1,48 @@
+import math
+
+import pytest
+
+from awstools.geoindex import (build_index, build_geocode_index,
+                               GeocodeIndex)
+
+# Rows as in the Geocode pickle, by priority
+GEO_DATA = [
+    ['London', 'London', 'GB', -0.12574, 51.50853, '2643743', 'city',
+     7556900],
+    ['New York', 'New York City', 'US', -74.00597, 40.71427, '5128581',
+     'city', 8175133],
+    ['Schweiz', 'Switzerland', 'CH', 8.01427, 47.00016, '2658434',
+     'country', 8484100],
+    ['Zürich', 'Zurich', 'CH', 8.55, 47.36667, '2657896', 'admin1',
+     1553423],
+    ['New', 'New', 'XX', 0., 0., '1', 'place', 40000],
+    ['Europe', 'Europe', float('nan'), 9.14062, 48.69096, '6255148',
+     'continent', 0],
+]
+
+
+def names(results):
+    return [result['name'] for result in results]
+
+
+def test_decode(tmp_path):
+    index = GeocodeIndex(build_index(GEO_DATA, str(tmp_path / 'geo.idx')))
+    assert names(index.decode('zürich, SCHWEIZ')) == ['Schweiz', 'Zürich'], \
+        'Names should be matched case-insensitively, in priority order'
+    assert names(index.decode('New York / London')) == \
+        ['London', 'New York'], 'The longest name should be matched'
+    assert names(index.decode('New Yorkshire')) == ['New'], \
+        'Names should end at a word boundary'
+    assert index.decode('Londonderry') == [], \
+        'Names should not match inside words'
+    assert index.decode('') == [], 'Empty locations have no match'
+    europe, = index.decode('europe')
+    assert math.isnan(europe['country_code']) and \
+        europe['official_name'] == 'Europe', 'Rows should be kept as is'
+    index.close()
+
+
+def test_missing_pickle(tmp_path):
+    (tmp_path / 'geonames_other.pkl').write_bytes(b'')
+    with pytest.raises(FileNotFoundError):
+        build_geocode_index(str(tmp_path))
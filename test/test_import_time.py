@@ -0,0 +1,47 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip('aenum')
+pytest.importorskip('boto3')
+pytest.importorskip('dacite')
+
+# Seconds allowed for importing the awstools modules used at runtime
+IMPORT_TIME_BUDGET = 1.0
+
+IMPORT_SCRIPT = """
+import time
+start = time.perf_counter()
+import awstools.session
+import awstools.s3
+import awstools.config
+import awstools.firehose
+import awstools.elasticsearch
+elapsed = time.perf_counter() - start
+import awstools.session as session
+assert session._session is None, 'session created at import'
+assert not session._clients, 'clients created at import'
+assert session._es is None, 'es client created at import'
+assert awstools.config._config_manager is None, 'config loaded at import'
+print(elapsed)
+"""
+
+
+def test_import_does_not_touch_aws():
+    # Unreachable endpoints: any client call at import would fail or hang
+    env = {
+        **os.environ,
+        'AWS_ACCESS_KEY_ID': 'test',
+        'AWS_SECRET_ACCESS_KEY': 'test',
+        'AWS_DEFAULT_REGION': 'us-east-1',
+        'HTTPS_PROXY': 'http://127.0.0.1:9',
+    }
+    result = subprocess.run(
+        [sys.executable, '-c', IMPORT_SCRIPT], env=env,
+        capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    elapsed = float(result.stdout.strip().splitlines()[-1])
+    assert elapsed < IMPORT_TIME_BUDGET, \
+        f'Importing awstools took {elapsed:.2f} s'
@@ -0,0 +1,61 @@
+import json
+import math
+
+import pytest
+
+from awstools import jsoncodec
+
+VALUES = [
+    {'a': 1, 'b': [True, None, 'x']},
+    {'nan': float('nan'), 'inf': [float('inf'), -float('inf')]},
+    [0.1, 1.5, 1e-05, 1.5e-07, 1e+16, 123456789.125, -0.0],
+    {'text': 'Zürich 東京 🙂', 'ctrl': '\n\t"\\'},
+    {'surrogate': 'a\ud800b'},
+    {'big': 2 ** 70},
+]
+
+
+@pytest.fixture(params=['orjson', 'json'])
+def codec(request, monkeypatch):
+    if request.param == 'orjson':
+        pytest.importorskip('orjson')
+    else:
+        monkeypatch.setattr(jsoncodec, 'orjson', None)
+    return request.param
+
+
+def expected(value):
+    """Value as decoded by a JSON parser, non-finite floats are null."""
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {key: expected(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [expected(item) for item in value]
+    return value
+
+
+@pytest.mark.parametrize('value', VALUES)
+def test_dumps_valid_json(codec, value):
+    data = jsoncodec.dumps(value)
+    assert json.loads(data) == expected(value), \
+        'Values should decode the same, NaN and infinities as null'
+    assert b'NaN' not in data and b'Infinity' not in data, \
+        'Output should be valid JSON'
+
+
+def test_dumps_same_bytes(codec):
+    assert jsoncodec.dumps(VALUES[0]) == b'{"a":1,"b":[true,null,"x"]}', \
+        'Output should be compact'
+    assert jsoncodec.dumps(VALUES[1]) == \
+        b'{"nan":null,"inf":[null,null]}', 'NaN should be written as null'
+    assert jsoncodec.dumps(VALUES[3]) == json.dumps(
+        VALUES[3], separators=(',', ':'), ensure_ascii=False).encode(), \
+        'Non-ASCII text should be written as UTF-8'
+    assert jsoncodec.dumps(VALUES[4]) == b'{"surrogate":"a\\ud800b"}', \
+        'Lone surrogates should be escaped'
+
+
+def test_loads(codec):
+    assert jsoncodec.loads(b'{"a":"\\ud800"}') == {'a': '\ud800'}, \
+        'Lone surrogates should be decoded'
@@ -0,0 +1,42 @@
+from types import SimpleNamespace
+
+from streamer.utils.match_keywords import KeywordMatcher, match_keywords
+
+config = [
+    SimpleNamespace(
+        keywords=["simon and garfunkel"], lang=["en"], slug="simongarfunkel"),
+    SimpleNamespace(
+        keywords=["flabbergasted"], lang=["en"], slug="flabbergasted"),
+    SimpleNamespace(
+        keywords=["Flabbergasted", "astonished"], lang=["de"],
+        slug="flabberstonished"),
+]
+
+
+def tweet(text, lang='en'):
+    return SimpleNamespace(keyword_matching_text=text, lang=lang)
+
+
+def test_match_single_word():
+    assert match_keywords(tweet('i am flabbergasted!'), config) == {
+        'flabbergasted': ['flabbergasted']
+    }, 'Incorrect single word match.'
+
+
+def test_match_multi_word():
+    matcher = KeywordMatcher(config)
+    assert matcher.match(tweet('garfunkel and simon')) == {
+        'simongarfunkel': ['simon and garfunkel']
+    }, 'Incorrect multi word match.'
+    assert matcher.match(tweet('simon says')) == {}, \
+        'Partial multi word match.'
+
+
+def test_match_lang():
+    matcher = KeywordMatcher(config)
+    assert matcher.match(tweet('flabbergasted and astonished', 'de')) == {
+        'flabberstonished': ['flabbergasted', 'astonished']
+    }, 'Incorrect language filter.'
+    assert matcher.match(tweet('astonished', 'und')) == {
+        'flabberstonished': ['astonished']
+    }, 'Undefined language should match all projects.'
@@ -0,0 +1,133 @@
+import json
+
+import pytest
+
+from streamer import metrics as metrics_module
+from streamer.metrics import Metrics, MetricsEmitter, to_emf, to_prometheus
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Wall clock of the registry, in seconds."""
+    now = [1000.]
+    monkeypatch.setattr(metrics_module.time, 'time', lambda: now[0])
+    return now
+
+
+def record(registry):
+    for seconds in [0.001, 0.002, 0.003, 0.010]:
+        registry.timing('match', seconds)
+    registry.timing('send', 0.5)
+    registry.count('tweets', 20)
+    registry.count('tweets.slug', 5)
+    registry.busy(4.)
+
+
+def test_compute(clock):
+    registry = Metrics()
+    registry.gauge('queue_depth', lambda: 7)
+    record(registry)
+    clock[0] += 10
+    snapshot = registry.compute(num_workers=2)
+
+    match = snapshot['stages']['match']
+    assert match['count'] == 4 and match['max'] == 0.010, \
+        'Timings should be counted per stage'
+    assert match['mean'] == pytest.approx(0.004)
+    assert match['p50'] == 0.003 and match['p99'] == 0.010
+    assert snapshot['rates'] == {'tweets': 2., 'tweets.slug': 0.5}, \
+        'Counters should be rates over the interval'
+    assert snapshot['gauges'] == {
+        'queue_depth': 7, 'worker_utilization': 0.2}, \
+        'Busy time should be divided by the time of all workers'
+    assert registry.snapshot == snapshot
+
+
+def test_compute_resets(clock):
+    registry = Metrics()
+    record(registry)
+    clock[0] += 10
+    registry.compute(num_workers=1)
+    registry.count('tweets', 5)
+    clock[0] += 5
+    snapshot = registry.compute(num_workers=1)
+    assert snapshot['stages'] == {} and snapshot['rates'] == {'tweets': 1.}, \
+        'Each interval should start from zero'
+    assert snapshot['gauges']['worker_utilization'] == 0.
+
+
+def test_collect_and_merge(clock):
+    worker = Metrics()
+    record(worker)
+    raw = worker.collect()
+    assert worker.collect() == {'timings': {}, 'counters': {}, 'busy': 0.}, \
+        'Collected data should be reset'
+
+    registry = Metrics()
+    record(registry)
+    registry.merge(raw)
+    clock[0] += 10
+    snapshot = registry.compute(num_workers=2)
+    assert snapshot['stages']['match']['count'] == 8 and \
+        snapshot['rates']['tweets'] == 4., \
+        'Merged data should add up with the local data'
+    assert snapshot['gauges']['worker_utilization'] == 0.4
+
+
+def test_to_emf(clock):
+    registry = Metrics()
+    record(registry)
+    clock[0] += 10
+    lines = to_emf(
+        registry.compute(num_workers=2), 'Test/Streamer', timestamp=1.5)
+    main, project = [json.loads(line) for line in lines]
+
+    metric, = main['_aws']['CloudWatchMetrics']
+    assert main['_aws']['Timestamp'] == 1500 and \
+        metric['Namespace'] == 'Test/Streamer' and \
+        metric['Dimensions'] == [[]]
+    units = {item['Name']: item['Unit'] for item in metric['Metrics']}
+    assert units['match_p99'] == 'Milliseconds' and \
+        main['match_p99'] == pytest.approx(10.), \
+        'Stage timings should be in milliseconds'
+    assert units['tweets_per_second'] == 'Count/Second' and \
+        main['tweets_per_second'] == 2.
+    assert units['worker_utilization'] == 'None'
+    assert set(units) == set(main) - {'_aws'}, \
+        'Every value should be declared as a metric'
+
+    metric, = project['_aws']['CloudWatchMetrics']
+    assert metric['Dimensions'] == [['project']] and \
+        project['project'] == 'slug' and \
+        project['tweets_per_second'] == 0.5, \
+        'Project rates should have the project dimension'
+
+
+def test_to_prometheus(clock):
+    registry = Metrics()
+    registry.timing('send', 0.5)
+    registry.count('tweets', 20)
+    registry.count('tweets.slug', 5)
+    clock[0] += 10
+    text = to_prometheus(registry.compute(num_workers=1))
+    assert text.splitlines() == [
+        'streamer_stage_seconds{stage="send",quantile="0.5"} 0.500000',
+        'streamer_stage_seconds{stage="send",quantile="0.99"} 0.500000',
+        'streamer_stage_seconds_max{stage="send"} 0.500000',
+        'streamer_stage_count{stage="send"} 1',
+        'streamer_tweets_per_second 2.000000',
+        'streamer_tweets_per_second{project="slug"} 0.500000',
+        'streamer_worker_utilization 0.000000',
+    ] and text.endswith('\n')
+    assert to_prometheus({}) == '\n', 'No snapshot yet, no metrics'
+
+
+def test_emitter_writes_emf(clock, capsys):
+    registry = Metrics()
+    record(registry)
+    clock[0] += 10
+    MetricsEmitter(registry, 2, namespace='Test/Streamer').emit()
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 2 and \
+        json.loads(lines[0])['tweets_per_second'] == 2., \
+        'EMF lines should be written to stdout'
@@ -0,0 +1,55 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('boto3')
+pytest.importorskip('dacite')
+
+from awstools.pipeline import iter_ahead, iter_chunks  # noqa
+
+
+def test_iter_chunks():
+    assert list(iter_chunks(range(5), 2)) == [[0, 1], [2, 3], [4]]
+
+
+def test_iter_ahead_reads_ahead():
+    read = []
+
+    def items():
+        for i in range(5):
+            read.append(i)
+            yield i
+
+    iterator = iter_ahead(items(), 2)
+    assert next(iterator) == 0
+    deadline = time.monotonic() + 1
+    while len(read) < 4 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert read == [0, 1, 2, 3], \
+        'Items should be read ahead, up to the given number'
+    assert list(iterator) == [1, 2, 3, 4], 'Items should keep their order'
+
+
+def test_iter_ahead_raises():
+    def items():
+        yield 1
+        raise ValueError('S3 Select failed')
+
+    iterator = iter_ahead(items(), 2)
+    assert next(iterator) == 1
+    with pytest.raises(ValueError):
+        next(iterator)
+
+
+def test_iter_ahead_stops():
+    n_threads = threading.active_count()
+    iterator = iter_ahead(iter(range(100)), 1)
+    next(iterator)
+    iterator.close()
+    deadline = time.monotonic() + 3
+    while threading.active_count() > n_threads and \
+            time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert threading.active_count() == n_threads, \
+        'The reading thread should stop when the caller stops'
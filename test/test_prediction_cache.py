@@ -0,0 +1,97 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip('aenum')
+
+from awstools import prediction_cache  # noqa
+from awstools.prediction_cache import DynamoDBStore  # noqa
+
+
+class FakeDynamoDB():
+    """Leaves the last item of each request unprocessed, `throttled`
+    times.
+    """
+    def __init__(self, throttled):
+        self.throttled = throttled
+        self.items = {}
+        self.requests = 0
+
+    def batch_write_item(self, RequestItems):
+        self.requests += 1
+        (table_name, requests), = RequestItems.items()
+        if self.throttled:
+            self.throttled -= 1
+            requests, unprocessed = requests[:-1], requests[-1:]
+        else:
+            unprocessed = []
+        for request in requests:
+            item = request['PutRequest']['Item']
+            self.items[item['key']['S']] = item['value']['S']
+        return {'UnprocessedItems': {table_name: unprocessed}
+                if unprocessed else {}}
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(prediction_cache.time, 'sleep', sleeps.append)
+    return sleeps
+
+
+def test_unprocessed_items_are_retried(sleeps):
+    client = FakeDynamoDB(throttled=2)
+    DynamoDBStore('table', client).put_many({'a': [1], 'b': [2]})
+    assert client.items == {'a': '[1]', 'b': '[2]'}, \
+        'Unprocessed items should be written again'
+    assert len(sleeps) == 2 and all(
+        0 <= seconds <= DynamoDBStore.BACKOFF * 2 ** (i + 1)
+        for i, seconds in enumerate(sleeps)), \
+        'Retries should back off exponentially'
+
+
+def test_retries_are_capped(sleeps):
+    client = FakeDynamoDB(throttled=100)
+    DynamoDBStore('table', client).put_many({'a': [1], 'b': [2]})
+    assert client.requests == DynamoDBStore.MAX_ATTEMPTS, \
+        'Retries should stop after MAX_ATTEMPTS requests'
+    assert max(sleeps) <= DynamoDBStore.MAX_BACKOFF
+
+
+FROM_ENV_SCRIPT = """
+from awstools.prediction_cache import prediction_cache_from_env
+cache = prediction_cache_from_env()
+store = cache.store
+# Settings are aenum constants, print their values
+print(int(cache.max_items), type(store).__name__,
+      str(store.table_name) if hasattr(store, 'table_name') else None)
+"""
+
+
+@pytest.mark.parametrize('settings, expected', [
+    ({}, '100000 NoneType None'),
+    ({'PREDICTION_CACHE_STORE': 'SQLite', 'PREDICTION_CACHE_SIZE': '10'},
+     '10 SQLiteStore None'),
+    ({'PREDICTION_CACHE_STORE': 'dynamodb',
+      'PREDICTION_CACHE_TABLE': 'predictions'},
+     '100000 DynamoDBStore predictions'),
+])
+def test_prediction_cache_from_env(tmp_path, settings, expected):
+    # Settings are read at import, in a fresh interpreter
+    env = {
+        key: value for key, value in os.environ.items()
+        if not key.startswith('PREDICTION_CACHE_')}
+    env.update(
+        settings,
+        PREDICTION_CACHE_PATH=str(tmp_path / 'predictions.sqlite'))
+    result = subprocess.run(
+        [sys.executable, '-c', FROM_ENV_SCRIPT], env=env,
+        capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == expected, \
+        'The configured store should be used'
+    if 'SQLiteStore' in expected:
+        assert (tmp_path / 'predictions.sqlite').exists(), \
+            'The SQLite file should be at PREDICTION_CACHE_PATH'
@@ -0,0 +1,86 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('boto3')
+
+from awstools.env import KFEnv  # noqa
+from streamer import provision  # noqa
+
+
+class FakeAWS():
+    """Active delivery streams and existing indices, provisioned ones."""
+    def __init__(self, monkeypatch, manifest=None):
+        self.streams = set()
+        self.indices = set()
+        self.provisioned = []
+        self.manifest = manifest
+        monkeypatch.setattr(provision, 'load_manifest', lambda: self.manifest)
+        monkeypatch.setattr(provision, 'save_manifest', self.save_manifest)
+        monkeypatch.setattr(
+            provision, 'get_delivery_stream_status',
+            lambda name: 'ACTIVE' if name in self.streams else None)
+        monkeypatch.setattr(
+            provision, 'index_exists', self.indices.__contains__)
+        monkeypatch.setattr(provision, 'provision', self.provision)
+
+    def save_manifest(self, manifest):
+        self.manifest = manifest
+
+    def provision(self, confs, unmatched=False, max_workers=1):
+        resources = {}
+        slugs = [conf.slug for conf in confs]
+        if unmatched:
+            slugs.append(KFEnv.UNMATCHED_STREAM_NAME)
+        for slug in slugs:
+            self.provisioned.append(slug)
+            self.streams.add(f'stream-{slug}')
+            resources[slug] = {'stream': f'stream-{slug}'}
+            if slug != KFEnv.UNMATCHED_STREAM_NAME:
+                self.indices.add(f'index-{slug}')
+                resources[slug]['index'] = f'index-{slug}'
+        return resources
+
+
+def config_manager(*slugs):
+    return SimpleNamespace(
+        config=[SimpleNamespace(slug=slug, lang=['en']) for slug in slugs],
+        write=lambda: ','.join(slugs))
+
+
+def test_manifest_skips_provisioning(monkeypatch):
+    aws = FakeAWS(monkeypatch)
+    provision.ensure_provisioned(config_manager('a', 'b'))
+    assert sorted(aws.provisioned) == sorted(
+        ['a', 'b', KFEnv.UNMATCHED_STREAM_NAME]), \
+        'Everything should be provisioned without manifest'
+
+    aws.provisioned = []
+    manifest = aws.manifest
+    resources = provision.ensure_provisioned(config_manager('a', 'b'))
+    assert aws.provisioned == [] and aws.manifest is manifest, \
+        'Verified resources should not be provisioned again'
+    assert set(resources) == {'a', 'b', KFEnv.UNMATCHED_STREAM_NAME}
+
+
+def test_manifest_missing_resources(monkeypatch):
+    aws = FakeAWS(monkeypatch)
+    provision.ensure_provisioned(config_manager('a', 'b'))
+    aws.provisioned = []
+    aws.indices.remove('index-b')
+    provision.ensure_provisioned(config_manager('a', 'b', 'c'))
+    assert sorted(aws.provisioned) == ['b', 'c'], \
+        'Missing and new resources should be provisioned'
+    assert set(aws.manifest['resources']) == {
+        'a', 'b', 'c', KFEnv.UNMATCHED_STREAM_NAME}, \
+        'The manifest should be updated'
+
+
+def test_manifest_settings_changed(monkeypatch):
+    aws = FakeAWS(monkeypatch)
+    provision.ensure_provisioned(config_manager('a'))
+    aws.provisioned = []
+    aws.manifest['settings_key'] = 'other'
+    provision.ensure_provisioned(config_manager('a'))
+    assert sorted(aws.provisioned) == ['a', KFEnv.UNMATCHED_STREAM_NAME], \
+        'A manifest of other settings should be ignored'
@@ -0,0 +1,48 @@
+import pytest
+
+pytest.importorskip('botocore')
+pytest.importorskip('boto3')
+
+from awstools.s3 import get_long_s3_object, iter_s3_object_lines  # noqa
+
+GZIP_LINES = {'CompressionType': 'GZIP', 'JSON': {'Type': 'LINES'}}
+
+
+class FakeS3Client():
+    """Returns the payloads of S3 Select responses, in turn."""
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    def select_object_content(self, **params):
+        self.calls.append(params)
+        payloads, end = self.responses.pop(0)
+        events = [{'Records': {'Payload': payload}} for payload in payloads]
+        if end:
+            events.append({'End': {}})
+        return {'Payload': events}
+
+
+def test_lines_split_across_payloads():
+    client = FakeS3Client(
+        ([b'{"a": 1}\n{"a"', b': 2}\n', b'{"a": 3}\n'], True))
+    lines = list(iter_s3_object_lines('bucket', 'key', GZIP_LINES, client))
+    assert lines == [b'{"a": 1}\n', b'{"a": 2}\n', b'{"a": 3}\n'], \
+        'Lines should be complete'
+
+
+def test_resume_skips_yielded_lines():
+    client = FakeS3Client(
+        ([b'{"a": 1}\n{"a": 2}\n{"a"'], False),
+        ([b'{"a": 1}\n{"a": 2}\n{"a": 3}\n'], True))
+    records = list(iter_s3_object_lines(
+        'bucket', 'key', GZIP_LINES, client, decode=True))
+    assert records == [{'a': 1}, {'a': 2}, {'a': 3}], \
+        'Records should not be repeated after resuming'
+    assert len(client.calls) == 2, 'Query should be resumed once'
+
+
+def test_get_long_s3_object():
+    client = FakeS3Client(([b'{"a": 1}\n', b'{"a": 2}\n'], True))
+    assert get_long_s3_object('bucket', 'key', GZIP_LINES, client) == \
+        '{"a": 1}\n{"a": 2}\n', 'Should return all lines'
@@ -0,0 +1,92 @@
+import io
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('aenum')
+
+from awstools import jsoncodec  # noqa
+from awstools.sagemaker import InferenceScheduler  # noqa
+
+
+class FakeSageMaker():
+    """Labels every text with its length, fails on texts 'fail'."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+
+    def invoke_endpoint(self, EndpointName, Body, ContentType):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(0.01)
+        with self.lock:
+            self.running -= 1
+        texts = jsoncodec.loads(Body)['text']
+        if 'fail' in texts:
+            raise RuntimeError('ModelError')
+        return {'Body': io.BytesIO(jsoncodec.dumps({'predictions': [
+            {'labels': [str(len(text))], 'probabilities': [1.]}
+            for text in texts]}))}
+
+
+def test_outputs_keep_input_order():
+    client = FakeSageMaker()
+    scheduler = InferenceScheduler(
+        max_workers=8, max_per_endpoint=2, client=client)
+    texts = ['a' * i for i in range(1, 21)]
+    outputs = scheduler.predict('endpoint', texts, batch_size=3)
+    assert [output['labels'][0] for output in outputs] == \
+        [str(len(text)) for text in texts], 'Outputs should be aligned'
+    assert client.max_running <= 2, 'Endpoint concurrency should be limited'
+
+
+def test_failed_batch_is_isolated():
+    scheduler = InferenceScheduler(client=FakeSageMaker())
+    outputs = scheduler.predict('endpoint', ['a', 'fail', 'ccc'], 1)
+    assert outputs[1] is None, 'Failed batch should have no outputs'
+    assert outputs[0]['labels'] == ['1'] and outputs[2]['labels'] == ['3']
+
+
+def test_duplicate_texts_are_sent_once():
+    client = FakeSageMaker()
+    sent = []
+    invoke_endpoint = client.invoke_endpoint
+
+    def record(**params):
+        sent.extend(jsoncodec.loads(params['Body'])['text'])
+        return invoke_endpoint(**params)
+
+    client.invoke_endpoint = record
+    scheduler = InferenceScheduler(client=client)
+    outputs = scheduler.predict('endpoint', ['a', 'bb', 'a', 'a', 'bb'], 2)
+    assert sorted(sent) == ['a', 'bb'], 'Each text should be sent once'
+    assert [output['labels'][0] for output in outputs] == \
+        ['1', '2', '1', '1', '2'], 'Outputs should be scattered back'
+
+
+def test_cached_texts_are_not_sent(tmp_path):
+    from awstools.prediction_cache import PredictionCache, SQLiteStore
+
+    store = SQLiteStore(str(tmp_path / 'predictions.sqlite'))
+    client = FakeSageMaker()
+    scheduler = InferenceScheduler(
+        client=client, cache=PredictionCache(store=store))
+    scheduler.predict('endpoint', ['a', 'bb'], 10)
+
+    # A new container only shares the store
+    sent = []
+    invoke_endpoint = client.invoke_endpoint
+
+    def record(**params):
+        sent.extend(jsoncodec.loads(params['Body'])['text'])
+        return invoke_endpoint(**params)
+
+    client.invoke_endpoint = record
+    scheduler = InferenceScheduler(
+        client=client, cache=PredictionCache(store=store))
+    outputs = scheduler.predict('endpoint', ['a', 'ccc', 'bb'], 10)
+    assert sent == ['ccc'], 'Only the new text should be sent'
+    assert [output['labels'][0] for output in outputs] == ['1', '3', '2']
@@ -0,0 +1,28 @@
+import os
+
+from streamer.spill import SpillLog
+
+
+class FakeSender():
+    """Sends all records, remembers them per stream."""
+    def __init__(self):
+        self.sent = []
+
+    def send(self, stream_name, records):
+        self.sent.extend((stream_name, data) for data in records)
+        return []
+
+
+def test_replay_after_crash(tmp_path):
+    spill_log = SpillLog(str(tmp_path), replay_rate=10 ** 6)
+    spill_log.write('stream', [b'{"id": 1}\n', b'{"id": 2}\n'])
+    # Crash: the segment is left open
+    assert [name for name in os.listdir(tmp_path)
+            if name.endswith('.open')], 'The segment should still be open'
+
+    sender = FakeSender()
+    failed = SpillLog(str(tmp_path), replay_rate=10 ** 6).replay(sender)
+    assert failed == 0 and sender.sent == [
+        ('stream', b'{"id": 1}\n'), ('stream', b'{"id": 2}\n')], \
+        'Records of a segment left open should be replayed'
+    assert os.listdir(tmp_path) == [], 'Replayed segments should be removed'
@@ -0,0 +1,48 @@
+import pytest
+
+pytest.importorskip('boto3')
+pytest.importorskip('twiprocess')
+
+from awstools import jsoncodec  # noqa
+from streamer.tasks import (splice_project_fields,  # noqa
+                            without_project_fields)
+
+STATUSES = [
+    {},
+    {'id': 1, 'text': 'Zürich 🙂', 'user': {'location': None}},
+    {'id': 2, 'nan': float('nan'), 'entities': {'hashtags': []}},
+]
+
+
+def splice(status, slug, matching_keywords):
+    return splice_project_fields(
+        jsoncodec.dumps(without_project_fields(status)), slug,
+        matching_keywords)
+
+
+@pytest.mark.parametrize('status', STATUSES)
+@pytest.mark.parametrize('matching_keywords', [['zürich', 'basel'], None])
+def test_splice_project_fields(status, matching_keywords):
+    assert splice(status, 'slug', matching_keywords) == jsoncodec.dumps_line(
+        {**status, 'project': 'slug',
+         'matching_keywords': matching_keywords}), \
+        'Splicing should give the same bytes as serializing'
+
+
+def test_splice_existing_fields():
+    status = {'project': 'old', 'id': 1, 'matching_keywords': ['old']}
+    data = splice(status, 'slug', ['new'])
+    assert data == \
+        b'{"id":1,"project":"slug","matching_keywords":["new"]}\n', \
+        'Existing project fields should be replaced, not duplicated'
+    assert status['project'] == 'old', 'The status should not be modified'
+
+
+def test_run_import_creates_no_writers():
+    pytest.importorskip('tweepy')
+    # Spawned worker processes import the main module, streamer.run
+    import streamer.run  # noqa
+    from streamer import tasks
+    assert tasks._spill_log is None and tasks._sender is None and \
+        tasks._local_stores is None, \
+        'Importing streamer.run should not create the spill log or writers'
@@ -0,0 +1,70 @@
+import threading
+
+from streamer.work_queue import WorkQueue, OverflowPolicy
+
+
+def get_all(q):
+    items = []
+    while q.qsize():
+        items.append(q.get())
+        q.task_done()
+    return items
+
+
+def test_size_in_bytes():
+    q = WorkQueue(max_bytes=10, policy=OverflowPolicy.DROP_OLDEST)
+    q.put('ü' * 4)
+    assert q.stats()['bytes'] == 8, 'Items should be measured in bytes'
+    q.put('éé')
+    assert q.stats()['dropped'] == 1, \
+        'Items should not fit by number of characters'
+
+
+def test_block():
+    q = WorkQueue(max_items=2)
+    q.put('1')
+    q.put('2')
+    put = threading.Thread(target=q.put, args=('3',))
+    put.start()
+    put.join(0.1)
+    assert put.is_alive(), 'put should block while the queue is full'
+    assert q.get() == '1'
+    put.join(1)
+    assert not put.is_alive(), 'put should return once there is room'
+    assert get_all(q) == ['2', '3'] and q.stats()['dropped'] == 0
+
+
+def test_drop_oldest():
+    q = WorkQueue(max_items=2, policy=OverflowPolicy.DROP_OLDEST)
+    for item in '12345':
+        q.put(item)
+    assert q.stats()['dropped'] == 3, 'Dropped items should be counted'
+    assert get_all(q) == ['4', '5'], 'The oldest items should be dropped'
+    q.join()
+
+
+def test_spill(tmp_path):
+    q = WorkQueue(
+        max_items=2, policy=OverflowPolicy.SPILL, spill_dir=str(tmp_path))
+    for item in '12345':
+        q.put(item)
+    stats = q.stats()
+    assert stats['spilled'] == 3 and stats['spill_depth'] == 3 and \
+        stats['depth'] == 2, 'Items beyond capacity should be spilled'
+    assert q.get() == '1'
+    q.put('6')
+    assert q.stats()['spilled'] == 4, \
+        'Items should be spilled while spilled items are pending'
+    assert [q.get() for _ in range(5)] == ['2', '3', '4', '5', '6'], \
+        'Spilled items should be read back in order'
+    assert q.stats()['spill_depth'] == 0
+
+
+def test_get_batch_spilled(tmp_path):
+    q = WorkQueue(
+        max_items=2, policy=OverflowPolicy.SPILL, spill_dir=str(tmp_path))
+    for item in '12345':
+        q.put(item)
+    assert q.get_batch(4) == ['1', '2', '3', '4'], \
+        'Batches should include spilled items'
+    assert q.get_batch(4) == ['5'] and q.qsize() == 0